@@ -0,0 +1,64 @@
+"""
+Startup-time benchmark for lazy optional imports
+
+Compares cold-start time of `main.py` and the library API against an eager
+baseline that imports every installed optional backend up front (what
+utils/dependencies.py used to do). Each case runs in a fresh interpreter.
+
+Usage:
+    python benchmarks/startup_time.py [--runs 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.dependencies import is_module_installed
+
+# PyCryptodome is left out: PyPDF2 already imports it eagerly, so it is part of both cases
+OPTIONAL_MODULES = ['pikepdf', 'pypdf', 'boto3', 'watchdog']
+
+def time_command(args, runs):
+    """Median wall time in milliseconds of running a command in a fresh interpreter"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15, help="runs per case (default 15)")
+    args = parser.parse_args()
+
+    installed = [name for name in OPTIONAL_MODULES if is_module_installed(name)]
+    eager_imports = f"import {', '.join(installed)}; " if installed else ""
+    print(f"🔧 Installed optional modules: {', '.join(installed) or 'none'}")
+
+    cases = [
+        ("python startup (reference)", [sys.executable, '-c', 'pass'], None),
+        ("main.py --help", [sys.executable, 'main.py', '--help'],
+         [sys.executable, '-c', f"{eager_imports}import runpy, sys; sys.argv = ['main.py', '--help']; "
+                                f"runpy.run_path('main.py', run_name='__main__')"]),
+        ("library API (import utils.chunker)", [sys.executable, '-c', 'import utils.chunker'],
+         [sys.executable, '-c', f"{eager_imports}import utils.chunker"]),
+    ]
+
+    print(f"\n⏱️  Median of {args.runs} runs:")
+    for label, lazy_command, eager_command in cases:
+        lazy_ms = time_command(lazy_command, args.runs)
+        if eager_command is None:
+            print(f"   {label}: {lazy_ms:.1f} ms")
+            continue
+        eager_ms = time_command(eager_command, args.runs)
+        print(f"   {label}: lazy {lazy_ms:.1f} ms, eager {eager_ms:.1f} ms "
+              f"({eager_ms - lazy_ms:.1f} ms saved)")
+
+if __name__ == "__main__":
+    main()
@@ -3,86 +3,324 @@ PDF Chunking Tool with Compression - Refactored Version
 Main entry point for the application
 """
 import os
+import sys
+import argparse
+import threading
 import PyPDF2
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 # Import our custom modules
-from utils.dependencies import print_dependency_status
+from utils.dependencies import print_dependency_status, PIKEPDF_AVAILABLE
 from utils.file_utils import find_pdf_files, setup_directories, get_file_size_kb, display_directory_warnings_and_instructions
-from utils.encryption import is_pdf_encrypted, handle_encrypted_pdf, check_encryption_support
+from utils.encryption import is_pdf_encrypted, spool_decrypted_pdf, check_encryption_support, default_password_provider, private_spool_dir
 from utils.chunker import chunk_pdf_by_pages
+from utils.backend_selection import BackendSelector
+from utils.sinks import create_sink, OUTPUT_FORMATS
+from utils.watcher import FolderWatcher
+from utils.metrics import RunMetrics, start_metrics_server, StatusFileWriter
+from utils.compression import COMPRESSION_PROFILES, DEFAULT_COMPRESSION_PROFILE, new_compression_stats
 from utils.reporter import generate_report
-from utils.user_input import get_chunk_size, get_compression_settings
+from utils.user_input import get_chunk_size, get_compression_settings, get_compression_profile_name, get_backend_selection_mode, get_output_format, get_s3_destination, get_chunk_optimization
 
-def process_pdf_files(pdf_files, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality):
-    """Process all PDF files and return chunking information"""
-    all_chunks_info = {}
+def process_pdf_file(pdf_file, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality,
+                     compression_profile=DEFAULT_COMPRESSION_PROFILE, backend_selector=None,
+                     password_provider=None, sink=None, optimize_chunks=True, on_chunk=None):
+    """Process a single PDF file and return its chunking information"""
+    if password_provider is None:
+        password_provider = default_password_provider()
     
-    for i, pdf_file in enumerate(pdf_files, 1):
-        print(f"\n📋 Progress: {i}/{len(pdf_files)}")
-        pdf_path = os.path.join(files_dir, pdf_file)
+    pdf_path = os.path.join(files_dir, pdf_file)
+    original_size = 0
+    
+    try:
+        original_size = get_file_size_kb(pdf_path)
         
-        try:
-            original_size = get_file_size_kb(pdf_path)
-            
-            # Check if PDF is encrypted first
-            if is_pdf_encrypted(pdf_path) and not check_encryption_support():
-                print(f"   🔒 Skipping encrypted PDF (PyCryptodome not available)")
-                all_chunks_info[pdf_file] = {
+        # Check if PDF is encrypted first
+        is_encrypted = is_pdf_encrypted(pdf_path)
+        if is_encrypted and not check_encryption_support():
+            print(f"   🔒 Skipping encrypted PDF (PyCryptodome not available)")
+            return {
+                'filename': pdf_file,
+                'original_size': original_size,
+                'total_pages': 0,
+                'chunks': [],
+                'status': 'Skipped: Encrypted PDF requires PyCryptodome'
+            }
+        
+        # Decrypt once into a plaintext spool shared by page counting, chunking and compression
+        decrypted_path = None
+        if is_encrypted:
+            decrypted_path = spool_decrypted_pdf(pdf_path, password_provider, private_spool_dir(chunks_dir))
+            if decrypted_path is None:
+                return {
                     'filename': pdf_file,
                     'original_size': original_size,
                     'total_pages': 0,
                     'chunks': [],
-                    'status': 'Skipped: Encrypted PDF requires PyCryptodome'
+                    'status': 'Failed: Could not decrypt PDF'
                 }
-                continue
-            
+        
+        try:
             # Get total pages for reporting
-            with open(pdf_path, 'rb') as file:
+            with open(decrypted_path or pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Handle encryption if needed
-                if pdf_reader.is_encrypted:
-                    decrypted_reader = handle_encrypted_pdf(pdf_path)
-                    if decrypted_reader is None:
-                        all_chunks_info[pdf_file] = {
-                            'filename': pdf_file,
-                            'original_size': original_size,
-                            'total_pages': 0,
-                            'chunks': [],
-                            'status': 'Failed: Could not decrypt PDF'
-                        }
-                        continue
-                    pdf_reader = decrypted_reader
-                
                 total_pages = len(pdf_reader.pages)
             
             # Process the PDF file
-            chunks = chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks, compression_quality)
-            
-            all_chunks_info[pdf_file] = {
-                'filename': pdf_file,
-                'original_size': original_size,
-                'total_pages': total_pages,
-                'chunks': chunks,
-                'status': 'Success' if chunks else 'Failed'
-            }
-            
-        except Exception as e:
-            print(f"   ❌ Failed to process {pdf_file}: {str(e)}")
-            all_chunks_info[pdf_file] = {
-                'filename': pdf_file,
-                'original_size': 0,
-                'total_pages': 0,
-                'chunks': [],
-                'status': f'Error: {str(e)}'
-            }
+            compression_stats = new_compression_stats(compression_profile)
+            chunks = chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks, compression_quality,
+                                        compression_profile, compression_stats, backend_selector,
+                                        password_provider, decrypted_path, sink, optimize_chunks, on_chunk)
+        finally:
+            if decrypted_path and os.path.exists(decrypted_path):
+                os.remove(decrypted_path)
+        
+        return {
+            'filename': pdf_file,
+            'original_size': original_size,
+            'total_pages': total_pages,
+            'chunks': chunks,
+            'compression': compression_stats,
+            'status': 'Success' if chunks else 'Failed'
+        }
+        
+    except Exception as e:
+        print(f"   ❌ Failed to process {pdf_file}: {str(e)}")
+        return {
+            'filename': pdf_file,
+            'original_size': original_size,
+            'total_pages': 0,
+            'chunks': [],
+            'status': f'Error: {str(e)}'
+        }
+
+def mark_failed_uploads(file_info, failures):
+    """Flag chunks the sink could not store and fail their file, returns the number of lost chunks"""
+    failed_chunks = [chunk for chunk in file_info['chunks'] if chunk['path'] in failures]
+    for chunk in failed_chunks:
+        chunk['upload_error'] = failures[chunk['path']]
+    if failed_chunks:
+        file_info['status'] = f"Failed: {len(failed_chunks)} of {len(file_info['chunks'])} chunks not uploaded"
+    return len(failed_chunks)
+
+def process_pdf_files(pdf_files, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality,
+                      compression_profile=DEFAULT_COMPRESSION_PROFILE, backend_selector=None,
+                      password_provider=None, sink=None, metrics=None, optimize_chunks=True):
+    """Process all PDF files and return chunking information"""
+    all_chunks_info = {}
+    if password_provider is None:
+        password_provider = default_password_provider()
+    file_sizes = {pdf_file: os.path.getsize(os.path.join(files_dir, pdf_file)) for pdf_file in pdf_files}
+    if metrics is not None:
+        metrics.add_files(len(pdf_files), sum(file_sizes.values()))
+    
+    for i, pdf_file in enumerate(pdf_files, 1):
+        print(f"\n📋 Progress: {i}/{len(pdf_files)}")
+        on_chunk = None
+        if metrics is not None:
+            metrics.file_started(pdf_file, file_sizes[pdf_file])
+            on_chunk = partial(metrics.chunk_committed, pdf_file)
+        all_chunks_info[pdf_file] = process_pdf_file(
+            pdf_file, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality,
+            compression_profile, backend_selector, password_provider, sink, optimize_chunks, on_chunk
+        )
+        if metrics is not None:
+            metrics.file_finished(all_chunks_info[pdf_file])
     
     return all_chunks_info
 
+def parse_args():
+    """Parse command line options; settings not given are prompted for (or defaulted in watch mode)"""
+    parser = argparse.ArgumentParser(description="Split large PDF files into size-limited chunks")
+    parser.add_argument('--max-size-kb', type=float,
+                        help="maximum chunk size in KB (required with --watch)")
+    parser.add_argument('--compress', action=argparse.BooleanOptionalAction,
+                        help="compress chunks that get close to the size limit (default on)")
+    parser.add_argument('--quality', type=int, choices=range(1, 101), metavar='1-100',
+                        help="image compression quality (default 60)")
+    parser.add_argument('--profile', choices=list(COMPRESSION_PROFILES),
+                        help=f"compression profile (default {DEFAULT_COMPRESSION_PROFILE})")
+    parser.add_argument('--race-backends', action=argparse.BooleanOptionalAction,
+                        help="race compression backends and reuse the smallest-output winner (default off)")
+    parser.add_argument('--optimize-chunks', action=argparse.BooleanOptionalAction,
+                        help="prune, dedupe and subset fonts in each committed chunk with pikepdf (default on)")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS,
+                        help="where committed chunks are written (default directory)")
+    parser.add_argument('--s3-bucket',
+                        help="bucket for the s3 output format (default $CHONKIE_S3_BUCKET)")
+    parser.add_argument('--s3-prefix',
+                        help="key prefix for the s3 output format (default $CHONKIE_S3_PREFIX)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and process new or changed PDFs as they appear in the files directory")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="seconds a file must stop changing before it is processed in watch mode (default 2)")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="number of files processed concurrently in watch mode (default 2)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve live Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument('--status-file',
+                        help="periodically rewrite live progress metrics as JSON to this path")
+    parser.add_argument('--status-interval', type=float, default=5.0,
+                        help="seconds between status file updates (default 5)")
+    args = parser.parse_args()
+    
+    if args.max_size_kb is not None and args.max_size_kb <= 0:
+        parser.error("--max-size-kb must be a positive number")
+    # The daemon runs without a terminal, so nothing may be prompted for
+    if args.watch and args.max_size_kb is None:
+        parser.error("--watch requires --max-size-kb")
+    if args.watch and args.output_format == 's3' and not (args.s3_bucket or os.environ.get('CHONKIE_S3_BUCKET')):
+        parser.error("--watch with --output-format s3 requires --s3-bucket or CHONKIE_S3_BUCKET")
+    return args
+
+def resolve_settings(args):
+    """
+    Combine command line options with prompts for anything not given
+    In watch mode nothing is prompted for and missing options take their defaults
+    Returns: (max_size_kb, compress_chunks, compression_quality, compression_profile,
+              race_backends, optimize_chunks, output_format, s3_bucket, s3_prefix)
+    """
+    interactive = not args.watch
+    
+    max_size_kb = args.max_size_kb if args.max_size_kb is not None else get_chunk_size()
+    
+    if args.compress is None and args.quality is None and interactive:
+        compress_chunks, compression_quality = get_compression_settings()
+    else:
+        compress_chunks = args.compress is not False
+        compression_quality = args.quality if args.quality is not None else 60
+    
+    compression_profile = args.profile or DEFAULT_COMPRESSION_PROFILE
+    race_backends = bool(args.race_backends)
+    if compress_chunks and interactive:
+        if args.profile is None:
+            compression_profile = get_compression_profile_name()
+        if args.race_backends is None:
+            race_backends = get_backend_selection_mode()
+    
+    optimize_chunks = args.optimize_chunks is not False
+    if args.optimize_chunks is None and interactive and PIKEPDF_AVAILABLE:
+        optimize_chunks = get_chunk_optimization()
+    
+    output_format = args.output_format or (get_output_format() if interactive else 'directory')
+    
+    s3_bucket, s3_prefix = None, ''
+    if output_format == 's3':
+        if args.s3_bucket or not interactive:
+            s3_bucket = args.s3_bucket or os.environ.get('CHONKIE_S3_BUCKET')
+            s3_prefix = args.s3_prefix if args.s3_prefix is not None else os.environ.get('CHONKIE_S3_PREFIX', '')
+        else:
+            s3_bucket, s3_prefix = get_s3_destination()
+    
+    return (max_size_kb, compress_chunks, compression_quality, compression_profile,
+            race_backends, optimize_chunks, output_format, s3_bucket, s3_prefix)
+
+def run_watch_mode(files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality, compression_profile,
+                   backend_selector, sink, settle_seconds, workers, metrics, optimize_chunks=True):
+    """Process PDFs as they are dropped into files_dir, refreshing the report after each file"""
+    password_provider = default_password_provider()
+    all_chunks_info = {}
+    processed_this_run = set()
+    report_lock = threading.Lock()
+    start_time = datetime.now()
+    
+    def process_file(pdf_file):
+        metrics.file_started(pdf_file, os.path.getsize(os.path.join(files_dir, pdf_file)))
+        file_info = process_pdf_file(pdf_file, files_dir, chunks_dir, max_size_kb, compress_chunks,
+                                     compression_quality, compression_profile, backend_selector,
+                                     password_provider, sink, optimize_chunks,
+                                     partial(metrics.chunk_committed, pdf_file))
+        # Wait for this file's uploads so the manifest and report see lost chunks
+        sink.flush([chunk['path'] for chunk in file_info['chunks']])
+        mark_failed_uploads(file_info, sink.failures())
+        metrics.file_finished(file_info)
+        return file_info
+    
+    def on_queued(pdf_file, signature):
+        metrics.add_files(1, signature['size'])
+    
+    def on_update(pdf_file, file_info):
+        with report_lock:
+            processed_this_run.add(pdf_file)
+            all_chunks_info[pdf_file] = file_info
+            report_path = generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, datetime.now(),
+                                          compress_chunks, compression_profile, sink.summary())
+            sink.add_report(report_path)
+    
+    watcher = FolderWatcher(files_dir, chunks_dir, process_file, on_update,
+                            settle_seconds=settle_seconds, max_workers=workers, on_queued=on_queued,
+                            remove_chunk=sink.remove)
+    # The report covers files processed before a restart too
+    all_chunks_info.update(watcher.processed_files())
+    try:
+        watcher.run()
+        sink.flush()
+    finally:
+        sink.close()
+    print(f"\n🎉 Watch mode stopped after processing {len(processed_this_run)} files")
+
+def run_batch_mode(files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality, compression_profile,
+                   backend_selector, sink, metrics, optimize_chunks=True):
+    """Process every PDF currently in files_dir once and write the report, returns False if chunks were lost"""
+    # Find all PDF files (we know they exist from the check above)
+    pdf_files = find_pdf_files(files_dir)
+    
+    print(f"\n🔍 Found {len(pdf_files)} PDF files to process")
+    print(f"📊 Maximum chunk size: {max_size_kb} KB")
+    print(f"🗜️  Compression: {'Enabled' if compress_chunks else 'Disabled'}")
+    if compress_chunks:
+        print(f"🎨 Image quality: {compression_quality}%")
+        print(f"⚡ Compression profile: {compression_profile}")
+        print(f"🏁 Backend selection: {'Race and learn winner' if backend_selector else 'Fixed order'}")
+    print(f"✂️  Chunk optimization: {'Enabled' if optimize_chunks and PIKEPDF_AVAILABLE else 'Disabled'}")
+    
+    # Process files
+    start_time = datetime.now()
+    try:
+        all_chunks_info = process_pdf_files(
+            pdf_files, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality, compression_profile,
+            backend_selector, sink=sink, metrics=metrics, optimize_chunks=optimize_chunks
+        )
+        end_time = datetime.now()
+        
+        # Wait for background uploads so the report includes them
+        sink.flush()
+        failures = sink.failures()
+        lost_chunks = sum(mark_failed_uploads(info, failures) for info in all_chunks_info.values())
+        
+        # Generate report
+        print(f"\n📊 Generating report...")
+        report_path = generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_time, compress_chunks,
+                                      compression_profile, sink.summary())
+        sink.add_report(report_path)
+    finally:
+        # Finish archives even when interrupted, so chunks written so far stay readable
+        sink.close()
+    
+    # Final summary
+    total_chunks = sum(len(info['chunks']) for info in all_chunks_info.values())
+    successful_files = sum(1 for info in all_chunks_info.values() if info['status'] == 'Success')
+    
+    print(f"\n🎉 Processing Complete!")
+    print(f"✅ Successfully processed: {successful_files}/{len(pdf_files)} files")
+    print(f"📦 Total chunks created: {total_chunks}")
+    print(f"⏱️  Total time: {(end_time - start_time).total_seconds():.2f} seconds")
+    print(f"📄 Report saved: {report_path}")
+    if lost_chunks:
+        print(f"❌ {lost_chunks} chunks could not be uploaded, see the report")
+    
+    if backend_selector:
+        for document_class, backend in backend_selector.class_winners().items():
+            print(f"🏁 Learned backend for {document_class}: {backend}")
+    
+    return lost_chunks == 0
+
 def main():
-    """Main function to run the PDF chunking tool"""
+    """Main function to run the PDF chunking tool, returns the process exit code"""
+    args = parse_args()
+    
     # ASCII Art for Chonkie PDF
     print("""
  ██████╗██╗  ██╗ ██████╗ ███╗   ██╗██╗  ██╗██╗███████╗    ██████╗ ██████╗ ███████╗
@@ -103,47 +341,46 @@ def main():
     
     # Check directory status and show warnings if needed
     print("\n🔍 Checking setup...")
-    if not display_directory_warnings_and_instructions():
+    if args.watch:
+        # An empty files directory is fine when waiting for drops
+        os.makedirs("files", exist_ok=True)
+    elif not display_directory_warnings_and_instructions():
         print("\n❌ Cannot proceed without proper setup. Please follow the instructions above.")
         return
     
-    # Get user preferences
-    max_size_kb = get_chunk_size()
-    compress_chunks, compression_quality = get_compression_settings()
+    # Get user preferences (from the command line, prompting for the rest outside watch mode)
+    (max_size_kb, compress_chunks, compression_quality, compression_profile,
+     race_backends, optimize_chunks, output_format, s3_bucket, s3_prefix) = resolve_settings(args)
+    backend_selector = BackendSelector() if compress_chunks and race_backends else None
+    if args.watch and output_format in ['zip', 'tar']:
+        print(f"⚠️  {output_format} archives cannot be updated incrementally, using directory output in watch mode")
+        output_format = 'directory'
     
     # Setup directories (this will now always succeed since we checked above)
     files_dir, chunks_dir = setup_directories()
-    print(f"📁 Chunks will be saved in: {chunks_dir}")
-    
-    # Find all PDF files (we know they exist from the check above)
-    pdf_files = find_pdf_files(files_dir)
-    
-    print(f"\n🔍 Found {len(pdf_files)} PDF files to process")
-    print(f"📊 Maximum chunk size: {max_size_kb} KB")
-    print(f"🗜️  Compression: {'Enabled' if compress_chunks else 'Disabled'}")
-    if compress_chunks:
-        print(f"🎨 Image quality: {compression_quality}%")
-    
-    # Process files
-    start_time = datetime.now()
-    all_chunks_info = process_pdf_files(
-        pdf_files, files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality
-    )
-    end_time = datetime.now()
-    
-    # Generate report
-    print(f"\n📊 Generating report...")
-    report_path = generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_time, compress_chunks)
+    sink = create_sink(output_format, chunks_dir, s3_bucket, s3_prefix, os.environ.get('CHONKIE_S3_ENDPOINT_URL'))
+    print(f"📁 Chunks will be saved in: {chunks_dir} ({output_format})")
     
-    # Final summary
-    total_chunks = sum(len(info['chunks']) for info in all_chunks_info.values())
-    successful_files = sum(1 for info in all_chunks_info.values() if info['chunks'])
+    # Live metrics for schedulers and dashboards
+    metrics = RunMetrics()
+    metrics_server = start_metrics_server(metrics, args.metrics_port) if args.metrics_port else None
+    status_writer = StatusFileWriter(metrics, args.status_file, args.status_interval).start() if args.status_file else None
     
-    print(f"\n🎉 Processing Complete!")
-    print(f"✅ Successfully processed: {successful_files}/{len(pdf_files)} files")
-    print(f"📦 Total chunks created: {total_chunks}")
-    print(f"⏱️  Total time: {(end_time - start_time).total_seconds():.2f} seconds")
-    print(f"📄 Report saved: {report_path}")
+    try:
+        if args.watch:
+            print(f"📊 Maximum chunk size: {max_size_kb} KB")
+            run_watch_mode(files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality,
+                           compression_profile, backend_selector, sink, args.settle, args.workers, metrics,
+                           optimize_chunks)
+        else:
+            if not run_batch_mode(files_dir, chunks_dir, max_size_kb, compress_chunks, compression_quality,
+                                  compression_profile, backend_selector, sink, metrics, optimize_chunks):
+                return 1
+    finally:
+        if status_writer:
+            status_writer.stop()
+        if metrics_server:
+            metrics_server.shutdown()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Font subsetting in the chunk-writing stage must keep every glyph a chunk can draw
+"""
+import io
+import pytest
+
+pikepdf = pytest.importorskip("pikepdf")
+pytest.importorskip("fontTools")
+PyPDF2 = pytest.importorskip("PyPDF2")
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
+
+from utils.chunk_writer import write_chunk
+
+GLYPH_COUNT = 100
+PAGE_GLYPHS = [36, 37]
+HIDDEN_GLYPHS = [61, 52]
+
+def build_font():
+    """TrueType font whose glyphs 1-99 are all drawn, so any dropped glyph is detectable"""
+    glyph_order = ['.notdef'] + [f"g{gid}" for gid in range(1, GLYPH_COUNT)]
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_order)
+    builder.setupCharacterMap({0x20 + gid: name for gid, name in enumerate(glyph_order) if gid})
+    glyphs = {}
+    for name in glyph_order:
+        pen = TTGlyphPen(None)
+        pen.moveTo((100, 0))
+        pen.lineTo((100, 700))
+        pen.lineTo((500, 700))
+        pen.closePath()
+        glyphs[name] = pen.glyph()
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({name: (600, 100) for name in glyph_order})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({'familyName': "Chonkie Test", 'styleName': "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    output = io.BytesIO()
+    builder.save(output)
+    return output.getvalue()
+
+def show_glyphs(gids):
+    hex_string = ''.join(f"{gid:04X}" for gid in gids)
+    return f"BT /F1 12 Tf 72 700 Td <{hex_string}> Tj ET".encode()
+
+def form(pdf, content, font):
+    return pdf.make_stream(content, Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Form,
+                           BBox=[0, 0, 200, 50], Resources=pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font)))
+
+def add_widget(pdf, page, **entries):
+    widget = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Annot, Subtype=pikepdf.Name.Widget, FT=pikepdf.Name.Btn, T="button",
+        Rect=[0, 0, 200, 50], **entries))
+    page.obj.Annots = pdf.make_indirect([widget])
+    pdf.Root.AcroForm = pikepdf.Dictionary(Fields=[widget])
+
+def place_in_down_appearance(pdf, page, font):
+    normal = form(pdf, show_glyphs(PAGE_GLYPHS), font)
+    down = form(pdf, show_glyphs(HIDDEN_GLYPHS), font)
+    add_widget(pdf, page, AP=pikepdf.Dictionary(N=normal, D=down))
+
+def place_in_rollover_state(pdf, page, font):
+    normal = form(pdf, show_glyphs(PAGE_GLYPHS), font)
+    rollover = form(pdf, show_glyphs(HIDDEN_GLYPHS), font)
+    add_widget(pdf, page, AS=pikepdf.Name.On,
+               AP=pikepdf.Dictionary(N=pikepdf.Dictionary(On=normal), R=pikepdf.Dictionary(On=rollover, Off=normal)))
+
+def place_in_tiling_pattern(pdf, page, font):
+    pattern = pdf.make_stream(show_glyphs(HIDDEN_GLYPHS), PatternType=1, PaintType=1, TilingType=1,
+                              BBox=[0, 0, 100, 100], XStep=100, YStep=100,
+                              Resources=pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font)))
+    page.obj.Resources.Pattern = pikepdf.Dictionary(P1=pattern)
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) + b" /Pattern cs /P1 scn 0 0 100 100 re f")
+
+def place_in_soft_mask(pdf, page, font):
+    group = form(pdf, show_glyphs(HIDDEN_GLYPHS), font)
+    group.Group = pikepdf.Dictionary(S=pikepdf.Name.Transparency)
+    page.obj.Resources.ExtGState = pikepdf.Dictionary(GS1=pikepdf.Dictionary(
+        SMask=pikepdf.Dictionary(S=pikepdf.Name.Luminosity, G=group)))
+    page.obj.Contents = pdf.make_stream(b"/GS1 gs " + show_glyphs(PAGE_GLYPHS))
+
+def place_in_type3_glyph(pdf, page, font):
+    char_proc = pdf.make_stream(b"0 0 d0 " + show_glyphs(HIDDEN_GLYPHS))
+    type3 = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type3, FontBBox=[0, 0, 1000, 1000],
+        FontMatrix=[0.001, 0, 0, 0.001, 0, 0], FirstChar=65, LastChar=65, Widths=[1000],
+        Encoding=pikepdf.Dictionary(Differences=[65, pikepdf.Name.a]),
+        CharProcs=pikepdf.Dictionary(a=char_proc),
+        Resources=pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))))
+    page.obj.Resources.Font.T3 = type3
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) + b" BT /T3 12 Tf (A) Tj ET")
+
+def make_font(pdf, font_name='ChonkieTest'):
+    """Type0 Identity-H font dictionary embedding its own copy of the test font"""
+    font_file = pdf.make_stream(build_font())
+    font_file.Length1 = len(font_file.read_bytes())
+    descriptor = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.FontDescriptor, FontName=pikepdf.Name('/' + font_name), Flags=4,
+        FontBBox=[0, -200, 1000, 800], ItalicAngle=0, Ascent=800, Descent=-200, CapHeight=700, StemV=80,
+        FontFile2=font_file))
+    cid_font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.CIDFontType2, BaseFont=pikepdf.Name('/' + font_name),
+        CIDSystemInfo=pikepdf.Dictionary(Registry="Adobe", Ordering="Identity", Supplement=0),
+        FontDescriptor=descriptor, CIDToGIDMap=pikepdf.Name.Identity))
+    return pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type0, BaseFont=pikepdf.Name('/' + font_name),
+        Encoding=pikepdf.Name('/Identity-H'), DescendantFonts=[cid_font]))
+
+def build_pdf(placement):
+    pdf = pikepdf.new()
+    font = make_font(pdf)
+
+    pdf.add_blank_page()
+    page = pdf.pages[0]
+    page.obj.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS))
+    placement(pdf, page, font)
+
+    output = io.BytesIO()
+    pdf.save(output)
+    output.seek(0)
+    return PyPDF2.PdfReader(output)
+
+def drawn_glyphs(chunk_data):
+    """Glyph ids with outlines in each of the chunk's embedded fonts, by font name"""
+    drawn = {}
+    with pikepdf.open(io.BytesIO(chunk_data)) as pdf:
+        for obj in pdf.objects:
+            if isinstance(obj, pikepdf.Dictionary) and obj.get('/Type') == '/FontDescriptor':
+                font = TTFont(io.BytesIO(obj.FontFile2.read_bytes()))
+                glyf = font['glyf']
+                drawn[str(obj.FontName)] = {gid for gid, name in enumerate(font.getGlyphOrder())
+                                            if glyf[name].numberOfContours > 0}
+    return drawn
+
+def place_after_restored_font(pdf, page, font):
+    page.obj.Resources.Font.F2 = make_font(pdf, 'ChonkieOther')
+    hidden = ''.join(f"{gid:04X}" for gid in HIDDEN_GLYPHS)
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) + b" q " + show_glyphs(PAGE_GLYPHS + HIDDEN_GLYPHS)
+                                        .replace(b"/F1", b"/F2") + f" Q BT <{hidden}> Tj ET".encode())
+
+def place_in_form_with_inherited_font(pdf, page, font):
+    hidden = ''.join(f"{gid:04X}" for gid in HIDDEN_GLYPHS)
+    text_only = pdf.make_stream(f"BT 72 600 Td <{hidden}> Tj ET".encode(), Type=pikepdf.Name.XObject,
+                                Subtype=pikepdf.Name.Form, BBox=[0, 0, 200, 50], Resources=pikepdf.Dictionary())
+    page.obj.Resources.XObject = pikepdf.Dictionary(Fm1=text_only)
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) + b" /Fm1 Do")
+
+def place_after_graphics_state_font(pdf, page, font):
+    hidden = ''.join(f"{gid:04X}" for gid in HIDDEN_GLYPHS)
+    page.obj.Resources.Font.F2 = make_font(pdf, 'ChonkieOther')
+    page.obj.Resources.ExtGState = pikepdf.Dictionary(GS1=pikepdf.Dictionary(Type=pikepdf.Name.ExtGState,
+                                                                             Font=[font, 12]))
+    page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) +
+                                        show_glyphs(PAGE_GLYPHS + HIDDEN_GLYPHS).replace(b"/F1", b"/F2") +
+                                        f" /GS1 gs BT 72 600 Td <{hidden}> Tj ET".encode())
+
+def place_in_form_shared_across_pages(pdf, page, font):
+    # The form has no resources, so /F1 is whichever font the page drawing it calls F1
+    shared = pdf.make_stream(show_glyphs(HIDDEN_GLYPHS), Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Form,
+                             BBox=[0, 0, 200, 50])
+    pdf.add_blank_page()
+    for page_font, shared_page in zip([font, make_font(pdf, 'ChonkieOther')], pdf.pages):
+        shared_page.obj.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=page_font),
+                                                       XObject=pikepdf.Dictionary(Fm1=shared))
+        shared_page.obj.Contents = pdf.make_stream(show_glyphs(PAGE_GLYPHS) + b" /Fm1 Do")
+
+def test_page_only_font_is_subset():
+    chunk_data = write_chunk(build_pdf(lambda pdf, page, font: None), [0])
+    assert drawn_glyphs(chunk_data) == {'/ChonkieTest': {0, *PAGE_GLYPHS}}
+
+@pytest.mark.parametrize("placement", [
+    place_in_down_appearance,
+    place_in_rollover_state,
+    place_in_tiling_pattern,
+    place_in_soft_mask,
+    place_in_type3_glyph,
+    place_after_restored_font,
+    place_in_form_with_inherited_font,
+    place_after_graphics_state_font,
+    place_in_form_shared_across_pages,
+])
+def test_glyphs_outside_page_content_are_kept(placement):
+    pdf_reader = build_pdf(placement)
+    chunk_data = write_chunk(pdf_reader, range(len(pdf_reader.pages)))
+    for font_name, glyphs in drawn_glyphs(chunk_data).items():
+        assert set(HIDDEN_GLYPHS) | set(PAGE_GLYPHS) <= glyphs, font_name
+
+def test_text_without_a_font_leaves_fonts_whole():
+    def place_text_before_font(pdf, page, font):
+        page.obj.Contents = pdf.make_stream(b"BT <003D> Tj ET " + show_glyphs(PAGE_GLYPHS))
+
+    chunk_data = write_chunk(build_pdf(place_text_before_font), [0])
+    assert len(drawn_glyphs(chunk_data)['/ChonkieTest']) == GLYPH_COUNT
@@ -0,0 +1,49 @@
+"""
+Profiles that process images must re-encode them at the requested quality
+"""
+import zlib
+import random
+import pytest
+
+pikepdf = pytest.importorskip("pikepdf")
+pytest.importorskip("PIL")
+
+from utils.compression import compress_pdf_pikepdf
+
+def build_pdf(path, color_space='/DeviceRGB', components=3):
+    """One page drawing a 200x200 noisy image stored with Flate"""
+    rng = random.Random(0)
+    pixels = bytes(rng.randrange(256) for _ in range(200 * 200 * components))
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    image = pdf.make_stream(zlib.compress(pixels), Type=pikepdf.Name.XObject, Subtype=pikepdf.Name.Image,
+                            Width=200, Height=200, ColorSpace=pikepdf.Name(color_space), BitsPerComponent=8,
+                            Filter=pikepdf.Name.FlateDecode)
+    pdf.pages[0].obj.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im1=image))
+    pdf.pages[0].obj.Contents = pdf.make_stream(b"q 200 0 0 200 0 0 cm /Im1 Do Q")
+    pdf.save(path)
+
+def image_of(path):
+    with pikepdf.open(path) as pdf:
+        image = pdf.pages[0].obj.Resources.XObject.Im1
+        return image.get('/Filter'), len(image.read_raw_bytes())
+
+@pytest.mark.parametrize("color_space, components", [('/DeviceRGB', 3), ('/DeviceGray', 1)])
+def test_balanced_recompresses_images_to_quality(tmp_path, color_space, components):
+    source = tmp_path / "source.pdf"
+    build_pdf(source, color_space, components)
+    _, original_size = image_of(source)
+
+    sizes = {}
+    for quality in [20, 80]:
+        output = tmp_path / f"q{quality}.pdf"
+        assert compress_pdf_pikepdf(str(source), str(output), quality, 'balanced')
+        image_filter, sizes[quality] = image_of(output)
+        assert image_filter == '/DCTDecode'
+    assert sizes[20] < sizes[80] < original_size
+
+def test_fast_leaves_images_alone(tmp_path):
+    source, output = tmp_path / "source.pdf", tmp_path / "fast.pdf"
+    build_pdf(source)
+    assert compress_pdf_pikepdf(str(source), str(output), 20, 'fast')
+    assert image_of(output) == image_of(source)
@@ -0,0 +1,32 @@
+"""
+Run metrics counters must only go up, including when a file fails partway through chunking
+"""
+from utils.metrics import RunMetrics, format_prometheus
+
+def test_failed_file_keeps_committed_chunks_and_adds_nothing_more():
+    metrics = RunMetrics()
+    metrics.add_files(1, 10240)
+    metrics.file_started('a.pdf', 10240)
+    metrics.chunk_committed('a.pdf', {'page_count': 5, 'size_kb': 40}, 10)
+    metrics.file_finished({'filename': 'a.pdf', 'original_size': 10, 'total_pages': 10, 'chunks': []})
+
+    snapshot = metrics.snapshot()
+    assert snapshot['pages_done'] == 5
+    assert snapshot['bytes_out'] == 40960
+    assert snapshot['files_failed'] == 1
+    assert snapshot['eta_seconds'] == 0
+
+def test_successful_file_adds_the_remainder_of_its_chunk_estimates():
+    metrics = RunMetrics()
+    metrics.add_files(2, 20480)
+    metrics.file_started('a.pdf', 10240)
+    metrics.chunk_committed('a.pdf', {'page_count': 2, 'size_kb': 1}, 4)
+    assert metrics.snapshot()['eta_seconds'] > 0
+    metrics.file_finished({'filename': 'a.pdf', 'original_size': 10, 'total_pages': 4,
+                           'chunks': [{'page_count': 2, 'size_kb': 1}, {'page_count': 2, 'size_kb': 2}]})
+
+    snapshot = metrics.snapshot()
+    assert snapshot['pages_done'] == 4
+    assert snapshot['bytes_in'] == 10240
+    assert snapshot['bytes_out'] == 3072
+    assert "chonkie_files_remaining 1" in format_prometheus(snapshot)
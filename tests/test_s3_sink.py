@@ -0,0 +1,107 @@
+"""
+S3Sink against a moto-mocked bucket: uploads, multipart, retries and failures
+"""
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from utils.sinks import S3Sink, REPORT_MEMBER_NAME
+from main import mark_failed_uploads
+
+BUCKET = "chonkie-chunks"
+
+@pytest.fixture
+def s3_client():
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+class FlakyClient:
+    """Delegates to a real client after failing the first `failures` uploads"""
+
+    def __init__(self, client, failures):
+        self.client = client
+        self.failures = failures
+        self.attempts = 0
+
+    def upload_fileobj(self, *args, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("connection reset")
+        return self.client.upload_fileobj(*args, **kwargs)
+
+def test_uploads_chunks_and_report(s3_client, tmp_path):
+    sink = S3Sink(BUCKET, prefix="run", client=s3_client)
+    location = sink.commit_chunk("doc.pdf", "doc-1.pdf", b"%PDF-1.4 chunk")
+    report_path = tmp_path / "chunking_report.txt"
+    report_path.write_text("report")
+    sink.add_report(str(report_path))
+    sink.close()
+
+    assert location == f"s3://{BUCKET}/run/doc/doc-1.pdf"
+    body = s3_client.get_object(Bucket=BUCKET, Key="run/doc/doc-1.pdf")["Body"].read()
+    assert body == b"%PDF-1.4 chunk"
+    assert s3_client.get_object(Bucket=BUCKET, Key=f"run/{REPORT_MEMBER_NAME}")["Body"].read() == b"report"
+
+    summary = sink.summary()
+    assert summary["destination"] == f"s3://{BUCKET}/run"
+    assert summary["uploaded"] == 2
+    assert summary["failed"] == 0
+    assert summary["retries"] == 0
+    assert summary["uploaded_kb"] == pytest.approx((len(b"%PDF-1.4 chunk") + len(b"report")) / 1024)
+    assert summary["queue_depth"] == 0
+    assert summary["max_queue_depth"] >= 1
+    assert summary["avg_queue_depth"] >= 1
+    assert sink.failures() == {}
+
+def test_large_chunks_use_multipart(s3_client):
+    sink = S3Sink(BUCKET, client=s3_client, multipart_threshold_mb=5, multipart_chunksize_mb=5)
+    sink.commit_chunk("big.pdf", "big-1.pdf", b"x" * (11 * 1024 * 1024))
+    sink.close()
+
+    # Multipart ETags end in -<part count>
+    assert s3_client.head_object(Bucket=BUCKET, Key="big/big-1.pdf")["ETag"].strip('"').endswith("-3")
+
+def test_retries_transient_failures(s3_client):
+    client = FlakyClient(s3_client, failures=2)
+    sink = S3Sink(BUCKET, client=client, max_retries=3, retry_delay=0.01)
+    sink.commit_chunk("doc.pdf", "doc-1.pdf", b"data")
+    sink.close()
+
+    assert client.attempts == 3
+    summary = sink.summary()
+    assert summary["uploaded"] == 1
+    assert summary["retries"] == 2
+    assert summary["failed"] == 0
+    assert s3_client.get_object(Bucket=BUCKET, Key="doc/doc-1.pdf")["Body"].read() == b"data"
+
+def test_failed_uploads_fail_the_file(s3_client):
+    client = FlakyClient(s3_client, failures=100)
+    sink = S3Sink(BUCKET, client=client, max_retries=2, retry_delay=0.01)
+    lost = sink.commit_chunk("doc.pdf", "doc-1.pdf", b"data")
+    sink.flush([lost])
+
+    assert client.attempts == 3
+    assert list(sink.failures()) == [lost]
+    summary = sink.summary()
+    assert summary["uploaded"] == 0
+    assert summary["failed"] == 1
+    assert summary["retries"] == 2
+
+    file_info = {
+        'filename': "doc.pdf",
+        'chunks': [{'filename': "doc-1.pdf", 'path': lost}, {'filename': "doc-2.pdf", 'path': "s3://other"}],
+        'status': 'Success',
+    }
+    assert mark_failed_uploads(file_info, sink.failures()) == 1
+    assert file_info['status'] == "Failed: 1 of 2 chunks not uploaded"
+    assert "connection reset" in file_info['chunks'][0]['upload_error']
+    assert 'upload_error' not in file_info['chunks'][1]
+
+    # A successful re-upload of the same key clears the failure
+    client.failures = 0
+    sink.commit_chunk("doc.pdf", "doc-1.pdf", b"data")
+    sink.close()
+    assert sink.failures() == {}
@@ -0,0 +1,33 @@
+"""
+Stale decrypted-spool directories are reaped by their owner lock, never by signalling a PID
+"""
+import os
+import subprocess
+import sys
+
+from utils.encryption import private_spool_dir
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def spool_dir_in_child(base_dir, exit_code):
+    """Create a spool directory from another process, returning its path and the still-running process if any"""
+    code = (f"import os, sys, time; from utils.encryption import private_spool_dir\n"
+            f"print(private_spool_dir({str(base_dir)!r}), flush=True)\n"
+            f"{exit_code}")
+    child = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE, stdin=subprocess.PIPE,
+                             text=True)
+    return child.stdout.readline().strip(), child
+
+def test_only_directories_of_dead_runs_are_removed(tmp_path):
+    # os._exit skips atexit, like a killed run
+    dead_dir, dead = spool_dir_in_child(tmp_path, "os._exit(0)")
+    dead.wait()
+    live_dir, live = spool_dir_in_child(tmp_path, "sys.stdin.read()")
+    try:
+        own_dir = private_spool_dir(tmp_path)
+        assert not os.path.exists(dead_dir)
+        assert os.path.isdir(live_dir)
+        assert os.path.isdir(own_dir)
+    finally:
+        live.communicate('')
+    assert not os.path.exists(live_dir)
@@ -0,0 +1,166 @@
+"""
+FolderWatcher debounce, in-flight handling, manifest restarts and stale chunk removal
+"""
+import os
+import types
+import pytest
+
+from utils import watcher as watcher_module
+from utils.watcher import FolderWatcher, MANIFEST_NAME
+from utils.sinks import DirectorySink
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watcher_module, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+@pytest.fixture
+def dirs(tmp_path):
+    files_dir, chunks_dir = tmp_path / "files", tmp_path / "chunks"
+    files_dir.mkdir()
+    chunks_dir.mkdir()
+    return str(files_dir), str(chunks_dir)
+
+def drop(files_dir, name, data, mtime=None):
+    path = os.path.join(files_dir, name)
+    with open(path, 'wb') as pdf_file:
+        pdf_file.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+def chunking_process(sink, files_dir):
+    """process_file committing one chunk per page, where a file's 'pages' are its bytes"""
+    def process_file(pdf_file):
+        with open(os.path.join(files_dir, pdf_file), 'rb') as pdf_file_data:
+            pages = pdf_file_data.read()
+        chunks = []
+        for number, page in enumerate(pages, 1):
+            chunk_name = f"{pdf_file[:-4]}-{number}.pdf"
+            chunks.append({'filename': chunk_name, 'path': sink.commit_chunk(pdf_file, chunk_name, bytes([page])),
+                           'size_kb': 1 / 1024, 'pages': [number], 'page_count': 1})
+        return {'filename': pdf_file, 'original_size': len(pages) / 1024, 'total_pages': len(pages),
+                'chunks': chunks, 'status': 'Success'}
+    return process_file
+
+def new_watcher(dirs, process_file=None, **options):
+    files_dir, chunks_dir = dirs
+    return FolderWatcher(files_dir, chunks_dir, process_file or (lambda pdf_file: None), settle_seconds=2.0, **options)
+
+def test_files_are_ready_once_they_stop_changing(dirs, clock):
+    watcher = new_watcher(dirs)
+    drop(dirs[0], "a.pdf", b"12", mtime=1)
+    watcher.notify("a.pdf")
+    assert watcher._ready_files() == []
+
+    clock.now += 1.5
+    drop(dirs[0], "a.pdf", b"123", mtime=2)
+    assert watcher._ready_files() == []
+
+    clock.now += 1.5
+    assert watcher._ready_files() == []
+
+    clock.now += 1.0
+    assert watcher._ready_files() == [("a.pdf", {'size': 3, 'mtime': 2})]
+    assert watcher._ready_files() == []
+    watcher.stop()
+
+def test_deleted_candidates_are_dropped(dirs, clock):
+    watcher = new_watcher(dirs)
+    drop(dirs[0], "a.pdf", b"1")
+    watcher.notify("a.pdf")
+    watcher._ready_files()
+    os.remove(os.path.join(dirs[0], "a.pdf"))
+    assert watcher._ready_files() == []
+    assert watcher._candidates == set() and watcher._pending == {}
+    watcher.stop()
+
+def test_in_flight_file_is_requeued_after_it_finishes(dirs, clock):
+    files_dir, _ = dirs
+    watcher = new_watcher(dirs, chunking_process(DirectorySink(dirs[1]), files_dir))
+    drop(files_dir, "a.pdf", b"1", mtime=1)
+    watcher._in_flight.add("a.pdf")
+    watcher.notify("a.pdf")
+    watcher._ready_files()
+    clock.now += 3
+    # Settled while its previous version is still processing: not handed out twice
+    assert watcher._ready_files() == []
+
+    watcher._run_file("a.pdf", {'size': 1, 'mtime': 1})
+    assert "a.pdf" not in watcher._in_flight
+    # The finished version is now in the manifest, a newer copy is processed after settling
+    drop(files_dir, "a.pdf", b"12", mtime=5)
+    watcher._ready_files()
+    clock.now += 3
+    assert watcher._ready_files() == [("a.pdf", {'size': 2, 'mtime': 5})]
+    watcher.stop()
+
+def test_restart_skips_unchanged_files_and_keeps_their_report(dirs, clock):
+    files_dir, chunks_dir = dirs
+    processed = []
+    process_file = chunking_process(DirectorySink(chunks_dir), files_dir)
+    watcher = new_watcher(dirs, lambda pdf_file: processed.append(pdf_file) or process_file(pdf_file))
+    drop(files_dir, "a.pdf", b"12", mtime=1)
+    watcher._run_file("a.pdf", {'size': 2, 'mtime': 1})
+    watcher.stop()
+    assert os.path.exists(os.path.join(chunks_dir, MANIFEST_NAME))
+
+    restarted = new_watcher(dirs)
+    restarted.notify("a.pdf")
+    assert restarted._ready_files() == []
+    assert restarted._candidates == set()
+    report = restarted.processed_files()
+    assert list(report) == ["a.pdf"]
+    assert [chunk['filename'] for chunk in report["a.pdf"]['chunks']] == ["a-1.pdf", "a-2.pdf"]
+    assert processed == ["a.pdf"]
+    restarted.stop()
+
+def test_changed_file_with_fewer_chunks_removes_stale_local_chunks(dirs, clock):
+    files_dir, chunks_dir = dirs
+    watcher = new_watcher(dirs, chunking_process(DirectorySink(chunks_dir), files_dir))
+    drop(files_dir, "a.pdf", b"123", mtime=1)
+    watcher._run_file("a.pdf", {'size': 3, 'mtime': 1})
+    drop(files_dir, "a.pdf", b"9", mtime=2)
+    watcher._run_file("a.pdf", {'size': 1, 'mtime': 2})
+    watcher.stop()
+
+    assert sorted(os.listdir(os.path.join(chunks_dir, "a"))) == ["a-1.pdf"]
+    with open(os.path.join(chunks_dir, "a", "a-1.pdf"), 'rb') as chunk_file:
+        assert chunk_file.read() == b"9"
+
+def test_changed_file_with_fewer_chunks_removes_stale_objects(dirs, clock):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    from utils.sinks import S3Sink
+
+    files_dir, _ = dirs
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="chonkie-chunks")
+        sink = S3Sink("chonkie-chunks", prefix="run", client=client)
+        process_file = chunking_process(sink, files_dir)
+
+        def process_and_flush(pdf_file):
+            file_info = process_file(pdf_file)
+            sink.flush()
+            return file_info
+
+        watcher = new_watcher(dirs, process_and_flush, remove_chunk=sink.remove)
+        drop(files_dir, "a.pdf", b"123", mtime=1)
+        watcher._run_file("a.pdf", {'size': 3, 'mtime': 1})
+        drop(files_dir, "a.pdf", b"9", mtime=2)
+        watcher._run_file("a.pdf", {'size': 1, 'mtime': 2})
+        watcher.stop()
+        sink.close()
+
+        keys = [item['Key'] for item in client.list_objects_v2(Bucket="chonkie-chunks")['Contents']]
+        assert keys == ["run/a/a-1.pdf"]
+        assert client.get_object(Bucket="chonkie-chunks", Key="run/a/a-1.pdf")['Body'].read() == b"9"
+        assert watcher.manifest["a.pdf"]['chunks'] == ["s3://chonkie-chunks/run/a/a-1.pdf"]
@@ -0,0 +1,91 @@
+"""
+Adaptive compression backend selection
+
+Backends are raced on the first compression of a document; the smallest
+output wins and is reused for the rest of that document. Wins are also
+tallied per document class so later documents of the same kind skip the
+race entirely.
+"""
+import math
+import threading
+
+def classify_document(pdf_reader, file_size_kb):
+    """
+    Derive a coarse document class from a PDF reader
+    Class is the producer name plus a power-of-two KB-per-page bucket
+    """
+    producer = 'unknown'
+    try:
+        metadata = pdf_reader.metadata
+        if metadata and metadata.get('/Producer'):
+            producer = str(metadata.get('/Producer')).split()[0].lower()
+    except Exception:
+        pass
+    
+    kb_per_page = file_size_kb / max(len(pdf_reader.pages), 1)
+    bucket = 2 ** int(math.log2(kb_per_page)) if kb_per_page >= 1 else 0
+    return f"{producer}:{bucket}KB/page"
+
+class BackendSelector:
+    """Remembers which compression backend wins per document and per document class"""
+    
+    def __init__(self, min_class_samples=2):
+        # A class winner is trusted once it has won this many races and holds a majority
+        self.min_class_samples = min_class_samples
+        self.document_winners = {}
+        self.class_wins = {}
+        self._lock = threading.Lock()
+    
+    def for_document(self, document_key, document_class=None, signature=None):
+        """
+        Get a selection handle bound to one document
+        signature identifies the document's contents (e.g. size and mtime); a winner
+        recorded for a different signature of the same document is not reused
+        """
+        return DocumentBackendSelection(self, document_key, document_class, signature)
+    
+    def choose(self, document_key, document_class=None, signature=None):
+        """Return the known winning backend, or None if a race is needed"""
+        with self._lock:
+            winner = self.document_winners.get(document_key)
+            if winner is not None and winner[0] == signature:
+                return winner[1]
+            
+            wins = self.class_wins.get(document_class)
+            if wins:
+                backend = max(wins, key=wins.get)
+                if wins[backend] >= self.min_class_samples and wins[backend] * 2 > sum(wins.values()):
+                    return backend
+        return None
+    
+    def record(self, document_key, document_class, backend, signature=None):
+        """Record the winner of a race"""
+        with self._lock:
+            # Replaces any winner learned from an earlier version of the document
+            self.document_winners[document_key] = (signature, backend)
+            if document_class is not None:
+                wins = self.class_wins.setdefault(document_class, {})
+                wins[backend] = wins.get(backend, 0) + 1
+    
+    def class_winners(self):
+        """Get the current leading backend for each document class"""
+        with self._lock:
+            return {
+                document_class: max(wins, key=wins.get)
+                for document_class, wins in self.class_wins.items()
+            }
+
+class DocumentBackendSelection:
+    """BackendSelector view for a single document, passed to compress_pdf_file"""
+    
+    def __init__(self, selector, document_key, document_class=None, signature=None):
+        self.selector = selector
+        self.document_key = document_key
+        self.document_class = document_class
+        self.signature = signature
+    
+    def choose(self):
+        return self.selector.choose(self.document_key, self.document_class, self.signature)
+    
+    def record(self, backend):
+        self.selector.record(self.document_key, self.document_class, backend, self.signature)
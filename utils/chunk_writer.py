@@ -0,0 +1,279 @@
+"""
+Chunk-writing stage
+
+Copying pages into a new PdfWriter drags along everything their resource
+dictionaries point at, so fonts and images shared across the whole document
+end up in every chunk. When pikepdf is available each chunk is rewritten:
+- resources its pages never reference are dropped
+- identical streams (fonts, images, forms) are stored once
+- embedded CID TrueType fonts are subset to the glyphs the chunk uses
+  (needs fontTools; glyph ids are kept so content streams stay valid)
+"""
+import io
+import hashlib
+import PyPDF2
+from .dependencies import PIKEPDF_AVAILABLE, FONTTOOLS_AVAILABLE, load_module
+
+TEXT_SHOWING_OPERATORS = {"Tj", "'", '"', "TJ"}
+# Font state of content that has not selected a font: (font_known, font_file)
+UNKNOWN_FONT = (False, None)
+
+def write_chunk(pdf_reader, page_indices, optimize=True):
+    """Return the bytes of a PDF holding the given pages of pdf_reader, through the chunk-writing stage if optimize"""
+    writer = PyPDF2.PdfWriter()
+    for page_index in page_indices:
+        writer.add_page(pdf_reader.pages[page_index])
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return optimize_chunk_data(buffer.getvalue()) if optimize else buffer.getvalue()
+
+def optimize_chunk_data(data):
+    """Run chunk bytes through the chunk-writing stage, returns them unchanged if pikepdf is missing or it does not help"""
+    if not PIKEPDF_AVAILABLE:
+        return data
+    try:
+        optimized = optimize_chunk(io.BytesIO(data))
+    except Exception as e:
+        print(f"      Warning: Could not optimize chunk, writing it unchanged: {e}")
+        return data
+    return optimized if len(optimized) < len(data) else data
+
+def optimize_chunk(source):
+    """Prune unused resources, subset fonts and dedupe identical streams of a chunk PDF, returns its bytes"""
+    pikepdf = load_module('pikepdf')
+    with pikepdf.open(source) as pdf:
+        # Shared /Resources dictionaries are copied per page before pruning
+        pdf.remove_unreferenced_resources()
+        if FONTTOOLS_AVAILABLE:
+            _subset_fonts(pdf, pikepdf)
+        _dedupe_streams(pdf, pikepdf)
+        # Only reachable objects are written, so dropped and duplicate objects disappear here
+        output = io.BytesIO()
+        pdf.save(output,
+                 compress_streams=True,
+                 object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        return output.getvalue()
+
+def _stream_digest(stream):
+    """Hash of a stream's raw data and dictionary (ignoring /Length)"""
+    digest = hashlib.sha256(bytes(stream.read_raw_bytes()))
+    for key in sorted(stream.stream_dict.keys()):
+        if key != '/Length':
+            value = stream.stream_dict[key]
+            digest.update(key.encode())
+            # Numbers and booleans come back as Python types without unparse()
+            digest.update(value.unparse() if hasattr(value, 'unparse') else repr(value).encode())
+    return digest.digest()
+
+def _remap_references(container, remap, pikepdf):
+    """Point every reference to a duplicate object at its canonical copy"""
+    if isinstance(container, pikepdf.Array):
+        entries = list(enumerate(container))
+    elif isinstance(container, pikepdf.Stream):
+        entries = list(container.stream_dict.items())
+        container = container.stream_dict
+    elif isinstance(container, pikepdf.Dictionary):
+        entries = list(container.items())
+    else:
+        return
+
+    for key, value in entries:
+        if getattr(value, 'is_indirect', False):
+            if value.objgen in remap:
+                container[key] = remap[value.objgen]
+        elif isinstance(value, (pikepdf.Array, pikepdf.Dictionary)):
+            _remap_references(value, remap, pikepdf)
+
+def _dedupe_streams(pdf, pikepdf):
+    """Keep one copy of each set of byte-identical streams"""
+    canonical = {}
+    remap = {}
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream):
+            digest = _stream_digest(obj)
+            if digest in canonical:
+                remap[obj.objgen] = canonical[digest]
+            else:
+                canonical[digest] = obj
+
+    if not remap:
+        return
+    for obj in list(pdf.objects):
+        _remap_references(obj, remap, pikepdf)
+
+def _subsettable_font_file(font):
+    """Return the FontFile2 stream of a Type0 Identity-H CIDFontType2 font, else None"""
+    if font.get('/Subtype') != '/Type0' or font.get('/Encoding') != '/Identity-H':
+        return None
+    descendants = font.get('/DescendantFonts')
+    if not descendants:
+        return None
+    cid_font = descendants[0]
+    if cid_font.get('/Subtype') != '/CIDFontType2':
+        return None
+    if cid_font.get('/CIDToGIDMap', '/Identity') != '/Identity':
+        return None
+    descriptor = cid_font.get('/FontDescriptor')
+    return descriptor.get('/FontFile2') if descriptor is not None else None
+
+def _unparsed_resource_owners(resources, pikepdf):
+    """
+    Objects with their own resources whose content streams are not scanned for glyphs:
+    tiling patterns, Type3 fonts (glyph procedures) and soft-mask transparency groups
+    """
+    if resources is None:
+        return []
+    owners = [pattern for pattern in resources.get('/Pattern', {}).values() if '/Resources' in pattern]
+    owners += [font for font in resources.get('/Font', {}).values() if font.get('/Subtype') == '/Type3']
+    for ext_gstate in resources.get('/ExtGState', {}).values():
+        soft_mask = ext_gstate.get('/SMask')
+        if isinstance(soft_mask, pikepdf.Dictionary) and '/G' in soft_mask:
+            owners.append(soft_mask.G)
+    return owners
+
+def _block_resource_fonts(resources, blocked):
+    """Exclude the subsettable fonts of a resource dictionary from subsetting"""
+    for font in (resources.get('/Font', {}) if resources is not None else {}).values():
+        font_file = _subsettable_font_file(font)
+        if font_file is not None:
+            blocked.add(font_file.objgen)
+
+def _block_font_files(resources, blocked, visited, pikepdf):
+    """Exclude every subsettable font reachable from a resource dictionary (including nested forms) from subsetting"""
+    if resources is None:
+        return
+    _block_resource_fonts(resources, blocked)
+
+    owners = [xobject for xobject in resources.get('/XObject', {}).values() if xobject.get('/Subtype') == '/Form']
+    for owner in owners + _unparsed_resource_owners(resources, pikepdf):
+        if owner.objgen != (0, 0):
+            if owner.objgen in visited:
+                continue
+            visited.add(owner.objgen)
+        _block_font_files(owner.get('/Resources'), blocked, visited, pikepdf)
+
+def _font_state_key(font_state):
+    font_known, font_file = font_state
+    return font_file.objgen if font_file is not None else font_known
+
+def _collect_glyph_usage(content_owner, resources, usage, blocked, visited, pikepdf,
+                         resources_key=None, font_state=UNKNOWN_FONT):
+    """
+    Record glyph ids shown with each subsettable font in a content stream, recursing into form XObjects
+    font_state is the caller's (font_known, font_file), used by forms that show text without selecting a font
+    Fonts reachable only through content that is not scanned, or shown when the font is unknown, are added to blocked
+    """
+    if resources_key is None:
+        resources_key = content_owner.objgen
+    if content_owner.objgen != (0, 0):
+        # A form without its own resources or font draws differently per caller, so it is scanned once per context
+        visit_key = (content_owner.objgen, resources_key, _font_state_key(font_state))
+        if visit_key in visited:
+            return
+        visited.add(visit_key)
+
+    fonts = resources.get('/Font', {}) if resources is not None else {}
+    xobjects = resources.get('/XObject', {}) if resources is not None else {}
+    ext_gstates = resources.get('/ExtGState', {}) if resources is not None else {}
+    # The font is part of the graphics state, so q/Q save and restore it
+    state_stack = []
+
+    for owner in _unparsed_resource_owners(resources, pikepdf):
+        _block_font_files(owner.get('/Resources'), blocked, set(), pikepdf)
+
+    for operands, operator in pikepdf.parse_content_stream(content_owner):
+        operator = str(operator)
+        if operator == 'q':
+            state_stack.append(font_state)
+        elif operator == 'Q':
+            if state_stack:
+                font_state = state_stack.pop()
+        elif operator == 'Tf' and operands:
+            font = fonts.get(str(operands[0]))
+            font_state = (True, _subsettable_font_file(font)) if font is not None else UNKNOWN_FONT
+        elif operator == 'gs' and operands:
+            ext_gstate = ext_gstates.get(str(operands[0]))
+            font_entry = ext_gstate.get('/Font') if ext_gstate is not None else None
+            if font_entry is not None:
+                font = font_entry[0] if isinstance(font_entry, pikepdf.Array) and len(font_entry) else None
+                font_state = (True, _subsettable_font_file(font)) if isinstance(font, pikepdf.Dictionary) else UNKNOWN_FONT
+        elif operator in TEXT_SHOWING_OPERATORS:
+            font_known, font_file = font_state
+            if not font_known:
+                # Any font of this stream's resources might be the one drawing
+                _block_resource_fonts(resources, blocked)
+                continue
+            if font_file is None:
+                continue
+            strings = operands[0] if operator == 'TJ' else operands[-1:]
+            glyphs = usage.setdefault(font_file.objgen, (font_file, set()))[1]
+            for item in strings:
+                if isinstance(item, pikepdf.String):
+                    data = bytes(item)
+                    glyphs.update(int.from_bytes(data[i:i + 2], 'big') for i in range(0, len(data) - 1, 2))
+        elif operator == 'Do' and operands:
+            xobject = xobjects.get(str(operands[0]))
+            if xobject is not None and xobject.get('/Subtype') == '/Form':
+                if '/Resources' in xobject:
+                    _collect_glyph_usage(xobject, xobject.Resources, usage, blocked, visited, pikepdf,
+                                         xobject.objgen, font_state)
+                else:
+                    _collect_glyph_usage(xobject, resources, usage, blocked, visited, pikepdf,
+                                         resources_key, font_state)
+
+def _subset_fonts(pdf, pikepdf):
+    """Subset embedded CID TrueType fonts to the glyphs used by the chunk's pages"""
+    subset = load_module('fontTools.subset')
+    ttLib = load_module('fontTools.ttLib')
+
+    usage = {}
+    blocked = set()
+    visited = set()
+    for page in pdf.pages:
+        _collect_glyph_usage(page.obj, page.obj.get('/Resources'), usage, blocked, visited, pikepdf)
+
+        # Appearance streams are drawn without going through the page content;
+        # each of the normal, down and rollover appearances may be a stream or a dict of states
+        for annotation in page.obj.get('/Annots', []):
+            appearance = annotation.get('/AP')
+            if appearance is None:
+                continue
+            for appearance_type in ['/N', '/D', '/R']:
+                entry = appearance.get(appearance_type)
+                if isinstance(entry, pikepdf.Stream):
+                    states = [entry]
+                elif isinstance(entry, pikepdf.Dictionary):
+                    states = [state for state in entry.values() if isinstance(state, pikepdf.Stream)]
+                else:
+                    states = []
+                for state in states:
+                    _collect_glyph_usage(state, state.get('/Resources'), usage, blocked, visited, pikepdf)
+
+    # Form fields regenerate appearances from the default resources with any glyph
+    acroform = pdf.Root.get('/AcroForm')
+    if acroform is not None:
+        _block_font_files(acroform.get('/DR'), blocked, set(), pikepdf)
+
+    for objgen, (font_file, glyphs) in usage.items():
+        if objgen in blocked:
+            continue
+        try:
+            original = bytes(font_file.read_bytes())
+            font = ttLib.TTFont(io.BytesIO(original))
+            glyph_count = font['maxp'].numGlyphs
+            options = subset.Options()
+            options.retain_gids = True
+            options.notdef_outline = True
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(gids=sorted(gid for gid in glyphs | {0} if gid < glyph_count))
+            subsetter.subset(font)
+
+            output = io.BytesIO()
+            font.save(output)
+            data = output.getvalue()
+            if len(data) < len(original):
+                font_file.write(data)
+                font_file.Length1 = len(data)
+        except Exception as e:
+            print(f"      Warning: Could not subset font: {e}")
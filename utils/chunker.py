@@ -3,83 +3,136 @@ PDF chunking functionality
 """
 import os
 import PyPDF2
-from .file_utils import get_file_size_kb, create_chunk_directory
-from .encryption import is_pdf_encrypted, handle_encrypted_pdf, check_encryption_support
-from .compression import compress_pdf_file
+from .file_utils import get_file_size_kb
+from .sinks import DirectorySink
+from .encryption import is_pdf_encrypted, spool_decrypted_pdf, check_encryption_support, private_spool_dir
+from .compression import compress_pdf_file, DEFAULT_COMPRESSION_PROFILE
+from .backend_selection import classify_document
+from .chunk_writer import write_chunk, optimize_chunk_data
 
-def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True, compression_quality=60):
+def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True, compression_quality=60,
+                       compression_profile=DEFAULT_COMPRESSION_PROFILE, compression_stats=None,
+                       backend_selector=None, password_provider=None, decrypted_path=None, sink=None,
+                       optimize_chunks=True, on_chunk=None):
     """
     Chunk a PDF file by pages to ensure each chunk is under max_size_kb
+    compression_stats (see new_compression_stats) collects the cost of every compression pass
+    backend_selector (see BackendSelector) races compression backends and reuses the winner
+    Encrypted PDFs are decrypted once into a plaintext spool (see spool_decrypted_pdf);
+    pass decrypted_path to reuse a spool the caller already created
+    Chunks are sized in memory and their final bytes handed to sink (see utils.sinks),
+    by default a DirectorySink on chunks_dir
+    optimize_chunks runs committed chunks through the chunk-writing stage (see utils.chunk_writer);
+    chunks are sized with the plain write and only optimized to check whether an oversized one still fits
+    on_chunk(chunk, total_pages) is called with each committed chunk's info dict (e.g. for live metrics)
     Returns list of created chunk files and their info
     """
     print(f"\n📄 Processing: {os.path.basename(pdf_path)}")
     print(f"   Original size: {get_file_size_kb(pdf_path):.2f} KB")
     
-    filename = os.path.basename(pdf_path)
-    chunk_info = []
+    if sink is None:
+        sink = DirectorySink(chunks_dir)
+    
+    source_path = decrypted_path or pdf_path
+    spool_path = None
     
     # Check if PDF is encrypted
-    if is_pdf_encrypted(pdf_path):
+    if decrypted_path is None and is_pdf_encrypted(pdf_path):
         print(f"   🔒 PDF is encrypted, attempting to decrypt...")
         if not check_encryption_support():
             print(f"   ❌ PyCryptodome is required for encrypted PDFs")
             print(f"   💡 Install with: pip install pycryptodome")
             return []
         
-        # Try to handle encrypted PDF
-        pdf_reader = handle_encrypted_pdf(pdf_path)
-        if pdf_reader is None:
+        # Decrypt once; every later pass reads the plaintext spool
+        spool_path = spool_decrypted_pdf(pdf_path, password_provider, private_spool_dir(chunks_dir))
+        if spool_path is None:
             return []
+        source_path = spool_path
+    
+    try:
+        return _chunk_source_pdf(pdf_path, source_path, max_size_kb, chunks_dir, compress_chunks,
+                                 compression_quality, compression_profile, compression_stats, backend_selector,
+                                 sink, optimize_chunks, on_chunk)
+    finally:
+        sink.end_document(os.path.basename(pdf_path))
+        if spool_path and os.path.exists(spool_path):
+            os.remove(spool_path)
+
+def _compress_chunk_data(data, chunk_name, chunks_dir, compression_quality, compression_profile,
+                         compression_stats, backend_selection):
+    """
+    Compress chunk bytes through a scratch file (the compression backends work on files)
+    Returns: (data, chunk_name) of the compressed chunk, or the inputs if compression did not help
+    """
+    scratch_path = os.path.join(chunks_dir, f"temp_{chunk_name}")
+    compressed_path = scratch_path.replace('.pdf', '_compressed.pdf')
+    try:
+        with open(scratch_path, 'wb') as scratch_file:
+            scratch_file.write(data)
+        success, final_path, ratio = compress_pdf_file(scratch_path, compressed_path, compression_quality,
+                                                       compression_profile, compression_stats, backend_selection)
+        if success:
+            with open(final_path, 'rb') as compressed_file:
+                return compressed_file.read(), chunk_name.replace('.pdf', '_compressed.pdf')
+        return data, chunk_name
+    finally:
+        for path in [scratch_path, compressed_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+def _chunk_source_pdf(pdf_path, source_path, max_size_kb, chunks_dir, compress_chunks, compression_quality,
+                      compression_profile, compression_stats, backend_selector, sink, optimize_chunks, on_chunk):
+    """Chunk the plaintext source_path, naming chunks after the original pdf_path"""
+    filename = os.path.basename(pdf_path)
+    chunk_info = []
     
     # Check if we should compress the original file first
     should_compress_original = False
+    backend_selection = None
     try:
-        with open(pdf_path, 'rb') as file:
+        with open(source_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
             
-            # Handle encryption if needed
-            if pdf_reader.is_encrypted:
-                if not check_encryption_support():
-                    print(f"   ❌ PyCryptodome is required for encrypted PDFs")
-                    print(f"   💡 Install with: pip install pycryptodome")
-                    return []
-                
-                # Try to decrypt
-                decrypted_reader = handle_encrypted_pdf(pdf_path)
-                if decrypted_reader is None:
-                    return []
-                pdf_reader = decrypted_reader
-            
             total_pages = len(pdf_reader.pages)
             
+            if backend_selector is not None:
+                # Size of the original, not of a decrypted spool, so encrypted files land in their generator's class
+                document_class = classify_document(pdf_reader, get_file_size_kb(pdf_path))
+                # Key on size and mtime too, so a changed file (watch mode) races again
+                stat = os.stat(pdf_path)
+                backend_selection = backend_selector.for_document(filename, document_class,
+                                                                  (stat.st_size, stat.st_mtime))
+            
             # Check if single pages are problematically large
             if total_pages > 1:
                 # Create a test single page to check its size
-                test_writer = PyPDF2.PdfWriter()
-                test_writer.add_page(pdf_reader.pages[0])
+                test_page = write_chunk(pdf_reader, [0], optimize_chunks)
                 
-                test_path = os.path.join(chunks_dir, "temp_test_page.pdf")
-                with open(test_path, 'wb') as test_file:
-                    test_writer.write(test_file)
-                
-                single_page_size = get_file_size_kb(test_path)
-                os.remove(test_path)
+                single_page_size = len(test_page) / 1024
                 
                 # If a single page is more than 80% of max size, we should compress
                 if single_page_size > (max_size_kb * 0.8):
                     should_compress_original = True
                     print(f"   ⚠️  Single page size ({single_page_size:.2f} KB) is large, will attempt compression")
+                    
+                    # Race backends on the sample page so the full document goes straight to the winner
+                    if compress_chunks and backend_selection is not None and backend_selection.choose() is None:
+                        print(f"   🏁 Selecting compression backend on a sample page...")
+                        _compress_chunk_data(test_page, f"test_page_{filename}", chunks_dir, compression_quality,
+                                             compression_profile, compression_stats, backend_selection)
     
     except Exception as e:
         print(f"   ❌ Error analyzing PDF: {e}")
         return []
     
     # Compress original if needed
-    working_pdf_path = pdf_path
+    working_pdf_path = source_path
     if should_compress_original and compress_chunks:
         print(f"   🗜️  Attempting to compress original PDF...")
         compressed_path = os.path.join(chunks_dir, f"compressed_{filename}")
-        success, compressed_path, ratio = compress_pdf_file(pdf_path, compressed_path, compression_quality)
+        success, compressed_path, ratio = compress_pdf_file(source_path, compressed_path, compression_quality,
+                                                  compression_profile, compression_stats, backend_selection)
         
         if success:
             working_pdf_path = compressed_path
@@ -93,68 +146,52 @@ def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True,
             total_pages = len(pdf_reader.pages)
             print(f"   Total pages: {total_pages}")
             
-            # Create directory for this file's chunks
-            file_chunk_dir = create_chunk_directory(chunks_dir, filename)
+            sink.begin_document(filename)
             
-            current_chunk = PyPDF2.PdfWriter()
             current_chunk_pages = 0
             chunk_number = 1
             pages_in_current_chunk = []
             
             page_num = 0
             while page_num < total_pages:
-                # Create a test chunk with the current page added
-                test_chunk = PyPDF2.PdfWriter()
-                
-                # Add all existing pages to test chunk
-                for existing_page_idx in range(current_chunk_pages):
-                    start_page_num = page_num - current_chunk_pages
-                    test_chunk.add_page(pdf_reader.pages[start_page_num + existing_page_idx])
+                # Build a test chunk in memory with the existing pages plus the current page
+                start_page_num = page_num - current_chunk_pages
+                chunk_name = f"{filename.replace('.pdf', '')}-{chunk_number}.pdf"
                 
-                # Add the new page to test chunk
-                test_chunk.add_page(pdf_reader.pages[page_num])
+                chunk_data = write_chunk(pdf_reader, range(start_page_num, page_num + 1), optimize=False)
+                optimized = False
                 
-                # Create temporary file to check size
-                temp_chunk_name = f"{filename.replace('.pdf', '')}-{chunk_number}.pdf"
-                temp_chunk_path = os.path.join(file_chunk_dir, temp_chunk_name)
+                # Optimizing is far more expensive than the plain write, so only do it when it decides the size
+                if optimize_chunks and len(chunk_data) / 1024 > max_size_kb:
+                    chunk_data = optimize_chunk_data(chunk_data)
+                    optimized = True
                 
-                with open(temp_chunk_path, 'wb') as temp_file:
-                    test_chunk.write(temp_file)
-                
-                test_size = get_file_size_kb(temp_chunk_path)
+                test_size = len(chunk_data) / 1024
                 
                 # If adding this page would exceed the limit
                 if test_size > max_size_kb and current_chunk_pages > 0:
                     # Save the current chunk without this page
-                    final_chunk = PyPDF2.PdfWriter()
-                    for existing_page_idx in range(current_chunk_pages):
-                        start_page_num = page_num - current_chunk_pages
-                        final_chunk.add_page(pdf_reader.pages[start_page_num + existing_page_idx])
-                    
-                    with open(temp_chunk_path, 'wb') as chunk_file:
-                        final_chunk.write(chunk_file)
+                    chunk_data = write_chunk(pdf_reader, range(start_page_num, page_num), optimize_chunks)
                     
                     # Try to compress the chunk if it's still large
-                    final_size = get_file_size_kb(temp_chunk_path)
+                    final_size = len(chunk_data) / 1024
                     if compress_chunks and final_size > max_size_kb * 0.8:
                         print(f"   🗜️  Compressing chunk {chunk_number}...")
-                        compressed_chunk_path = temp_chunk_path.replace('.pdf', '_compressed.pdf')
-                        success, final_path, ratio = compress_pdf_file(temp_chunk_path, compressed_chunk_path, compression_quality)
-                        
-                        if success:
-                            os.remove(temp_chunk_path)  # Remove uncompressed version
-                            temp_chunk_path = final_path
-                            temp_chunk_name = os.path.basename(final_path)
-                            final_size = get_file_size_kb(temp_chunk_path)
+                        chunk_data, chunk_name = _compress_chunk_data(chunk_data, chunk_name, chunks_dir,
+                                                                      compression_quality, compression_profile,
+                                                                      compression_stats, backend_selection)
+                        final_size = len(chunk_data) / 1024
                     
                     chunk_info.append({
                         'chunk_number': chunk_number,
-                        'filename': temp_chunk_name,
-                        'path': temp_chunk_path,
+                        'filename': chunk_name,
+                        'path': sink.commit_chunk(filename, chunk_name, chunk_data),
                         'size_kb': final_size,
                         'pages': pages_in_current_chunk.copy(),
                         'page_count': current_chunk_pages
                     })
+                    if on_chunk:
+                        on_chunk(chunk_info[-1], total_pages)
                     
                     print(f"   ✅ Chunk {chunk_number}: {current_chunk_pages} pages, {final_size:.2f} KB")
                     
@@ -172,24 +209,22 @@ def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True,
                     # Try to compress this oversized single page
                     if compress_chunks:
                         print(f"   🗜️  Attempting to compress oversized page...")
-                        compressed_chunk_path = temp_chunk_path.replace('.pdf', '_compressed.pdf')
-                        success, final_path, ratio = compress_pdf_file(temp_chunk_path, compressed_chunk_path, compression_quality)
-                        
-                        if success:
-                            os.remove(temp_chunk_path)  # Remove uncompressed version
-                            temp_chunk_path = final_path
-                            temp_chunk_name = os.path.basename(final_path)
-                            test_size = get_file_size_kb(temp_chunk_path)
+                        chunk_data, chunk_name = _compress_chunk_data(chunk_data, chunk_name, chunks_dir,
+                                                                      compression_quality, compression_profile,
+                                                                      compression_stats, backend_selection)
+                        test_size = len(chunk_data) / 1024
                     
                     # Save this oversized single page
                     chunk_info.append({
                         'chunk_number': chunk_number,
-                        'filename': temp_chunk_name,
-                        'path': temp_chunk_path,
+                        'filename': chunk_name,
+                        'path': sink.commit_chunk(filename, chunk_name, chunk_data),
                         'size_kb': test_size,
                         'pages': [page_num + 1],
                         'page_count': 1
                     })
+                    if on_chunk:
+                        on_chunk(chunk_info[-1], total_pages)
                     
                     status = "compressed" if compress_chunks and test_size < max_size_kb else "oversized"
                     print(f"   ✅ Chunk {chunk_number}: 1 page, {test_size:.2f} KB ({status})")
@@ -208,26 +243,28 @@ def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True,
                     
                     # If this is the last page, save the chunk
                     if page_num == total_pages - 1:
+                        if optimize_chunks and not optimized:
+                            chunk_data = optimize_chunk_data(chunk_data)
+                            test_size = len(chunk_data) / 1024
+                        
                         # Try to compress the final chunk if it's large
                         if compress_chunks and test_size > max_size_kb * 0.8:
                             print(f"   🗜️  Compressing final chunk {chunk_number}...")
-                            compressed_chunk_path = temp_chunk_path.replace('.pdf', '_compressed.pdf')
-                            success, final_path, ratio = compress_pdf_file(temp_chunk_path, compressed_chunk_path, compression_quality)
-                            
-                            if success:
-                                os.remove(temp_chunk_path)  # Remove uncompressed version
-                                temp_chunk_path = final_path
-                                temp_chunk_name = os.path.basename(final_path)
-                                test_size = get_file_size_kb(temp_chunk_path)
+                            chunk_data, chunk_name = _compress_chunk_data(chunk_data, chunk_name, chunks_dir,
+                                                                          compression_quality, compression_profile,
+                                                                          compression_stats, backend_selection)
+                            test_size = len(chunk_data) / 1024
                         
                         chunk_info.append({
                             'chunk_number': chunk_number,
-                            'filename': temp_chunk_name,
-                            'path': temp_chunk_path,
+                            'filename': chunk_name,
+                            'path': sink.commit_chunk(filename, chunk_name, chunk_data),
                             'size_kb': test_size,
                             'pages': pages_in_current_chunk.copy(),
                             'page_count': current_chunk_pages
                         })
+                        if on_chunk:
+                            on_chunk(chunk_info[-1], total_pages)
                         
                         print(f"   ✅ Chunk {chunk_number}: {current_chunk_pages} pages, {test_size:.2f} KB")
                 
@@ -236,11 +273,11 @@ def chunk_pdf_by_pages(pdf_path, max_size_kb, chunks_dir, compress_chunks=True,
             print(f"   🎉 Successfully created {len(chunk_info)} chunks")
             
             # Clean up compressed original if it was created
-            if working_pdf_path != pdf_path and os.path.exists(working_pdf_path):
+            if working_pdf_path != source_path and os.path.exists(working_pdf_path):
                 os.remove(working_pdf_path)
             
             return chunk_info
             
     except Exception as e:
         print(f"   ❌ Error processing {filename}: {str(e)}")
-        return [] 
\ No newline at end of file
+        return []
@@ -1,76 +1,171 @@
 """
 PDF compression utilities using various libraries
 """
+import io
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 import PyPDF2
-from .dependencies import PIKEPDF_AVAILABLE, PYPDF_AVAILABLE
+from .dependencies import PIKEPDF_AVAILABLE, PYPDF_AVAILABLE, load_module
 from .file_utils import get_file_size_kb
 
-# Import libraries conditionally
-if PIKEPDF_AVAILABLE:
-    import pikepdf
+# Compression profiles trade speed for output size.
+# - backends: order in which compression libraries are tried
+# - try_fallbacks: keep going down the backend list if one fails
+# - process_images: re-encode 8-bit RGB/gray images as JPEG at the requested quality (pikepdf)
+# - save_options: pikepdf save settings (linearization is an extra pass
+#   that only helps byte-serving over HTTP, so no profile enables it)
+COMPRESSION_PROFILES = {
+    'fast': {
+        'description': 'Single backend, streams only (lowest latency)',
+        'backends': ['pikepdf', 'pypdf', 'basic'],
+        'try_fallbacks': False,
+        'process_images': False,
+        'remove_unreferenced': False,
+        'dedupe_objects': False,
+        'save_options': {
+            'object_stream_mode': 'preserve',
+            'normalize_content': False,
+            'recompress_flate': False,
+            'linearize': False,
+        },
+    },
+    'balanced': {
+        'description': 'Object streams, resource cleanup and JPEG image recompression, with fallbacks',
+        'backends': ['pikepdf', 'pypdf', 'basic'],
+        'try_fallbacks': True,
+        'process_images': True,
+        'remove_unreferenced': True,
+        'dedupe_objects': True,
+        'save_options': {
+            'object_stream_mode': 'generate',
+            'normalize_content': False,
+            'recompress_flate': False,
+            'linearize': False,
+        },
+    },
+    'max': {
+        'description': 'Also normalize content and recompress every stream (archival)',
+        'backends': ['pikepdf', 'pypdf', 'basic'],
+        'try_fallbacks': True,
+        'process_images': True,
+        'remove_unreferenced': True,
+        'dedupe_objects': True,
+        'save_options': {
+            'object_stream_mode': 'generate',
+            'normalize_content': True,
+            'recompress_flate': True,
+            'linearize': False,
+        },
+    },
+}
 
-if PYPDF_AVAILABLE:
-    from pypdf import PdfWriter, PdfReader
+DEFAULT_COMPRESSION_PROFILE = 'balanced'
 
-def compress_pdf_pikepdf(input_path, output_path, quality=60):
+def get_compression_profile(name=None):
+    """Get a compression profile by name (defaults to the balanced profile)"""
+    if name is None:
+        name = DEFAULT_COMPRESSION_PROFILE
+    if name not in COMPRESSION_PROFILES:
+        raise ValueError(f"Unknown compression profile: {name} "
+                         f"(choose from {', '.join(COMPRESSION_PROFILES)})")
+    return COMPRESSION_PROFILES[name]
+
+def new_compression_stats(profile_name=None):
+    """Create an empty stats dict for measuring the cost of a compression profile"""
+    return {
+        'profile': profile_name or DEFAULT_COMPRESSION_PROFILE,
+        'passes': 0,
+        'successes': 0,
+        'seconds': 0.0,
+        'kb_saved': 0.0,
+        'races': 0,
+        'backends': {},
+    }
+
+def _recompress_image(image, quality, pikepdf):
+    """
+    Replace an 8-bit DeviceRGB/DeviceGray image with a JPEG at quality if that is smaller
+    Masks, decode arrays and other color spaces are left alone, since JPEG cannot carry them faithfully
+    """
+    if image.get('/ImageMask', False) or '/Decode' in image or image.get('/BitsPerComponent') != 8:
+        return False
+    color_space = image.get('/ColorSpace')
+    if color_space not in ['/DeviceRGB', '/DeviceGray']:
+        return False
+    
+    pil_image = pikepdf.PdfImage(image).as_pil_image()
+    output = io.BytesIO()
+    pil_image.convert('RGB' if color_space == '/DeviceRGB' else 'L').save(output, format='JPEG', quality=quality,
+                                                                             optimize=True)
+    if output.tell() >= len(image.read_raw_bytes()):
+        return False
+    image.write(output.getvalue(), filter=pikepdf.Name.DCTDecode)
+    if '/DecodeParms' in image:
+        del image['/DecodeParms']
+    return True
+
+def compress_pdf_pikepdf(input_path, output_path, quality=60, profile=None):
     """
     Compress PDF using pikepdf library with advanced compression
     """
     if not PIKEPDF_AVAILABLE:
         return False
+    
+    profile = get_compression_profile(profile)
+    save_options = profile['save_options']
         
     try:
+        pikepdf = load_module('pikepdf')
         with pikepdf.open(input_path) as pdf:
             # Apply various compression techniques
             
             # 1. Remove duplicate objects and orphaned objects
-            pdf.remove_unreferenced_resources()
+            if profile['remove_unreferenced']:
+                pdf.remove_unreferenced_resources()
             
-            # 2. Compress images if they exist
-            for page in pdf.pages:
-                try:
-                    # Get page resources
-                    if '/Resources' in page and '/XObject' in page['/Resources']:
-                        xobjects = page['/Resources']['/XObject']
-                        for name, obj in xobjects.items():
-                            if hasattr(obj, 'Subtype') and obj.Subtype == '/Image':
-                                try:
-                                    # Try to compress image
-                                    if hasattr(obj, 'as_pil_image'):
-                                        pil_image = obj.as_pil_image()
-                                        if pil_image.mode in ['RGB', 'RGBA', 'L']:
-                                            # This is a simplified approach - actual image replacement is complex
-                                            pass
-                                except Exception as e:
-                                    print(f"      Warning: Could not process image {name}: {e}")
-                                    continue
-                except Exception as e:
-                    print(f"      Warning: Could not process images on page: {e}")
-                    continue
+            # 2. Re-encode images as JPEG at the requested quality
+            if profile['process_images']:
+                recompressed = set()
+                for page in pdf.pages:
+                    xobjects = page.obj.get('/Resources', {}).get('/XObject', {})
+                    for name, obj in xobjects.items():
+                        if obj.get('/Subtype') != '/Image' or obj.objgen in recompressed:
+                            continue
+                        recompressed.add(obj.objgen)
+                        try:
+                            _recompress_image(obj, quality, pikepdf)
+                        except Exception as e:
+                            print(f"      Warning: Could not process image {name}: {e}")
             
             # Save compressed PDF with compression options
+            object_stream_mode = getattr(pikepdf.ObjectStreamMode, save_options['object_stream_mode'])
             pdf.save(output_path, 
                     compress_streams=True, 
-                    object_stream_mode=pikepdf.ObjectStreamMode.generate,
-                    normalize_content=True,
-                    linearize=True)
+                    object_stream_mode=object_stream_mode,
+                    normalize_content=save_options['normalize_content'],
+                    recompress_flate=save_options['recompress_flate'],
+                    linearize=save_options['linearize'])
             return True
             
     except Exception as e:
         print(f"      Error with pikepdf compression: {e}")
         return False
 
-def compress_pdf_pypdf(input_path, output_path):
+def compress_pdf_pypdf(input_path, output_path, profile=None):
     """
     Compress PDF using pypdf library
     """
     if not PYPDF_AVAILABLE:
         return False
+    
+    profile = get_compression_profile(profile)
         
     try:
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
+        pypdf = load_module('pypdf')
+        reader = pypdf.PdfReader(input_path)
+        writer = pypdf.PdfWriter()
         
         # Copy all pages
         for page in reader.pages:
@@ -85,10 +180,11 @@ def compress_pdf_pypdf(input_path, output_path):
                 continue
         
         # Remove duplicate objects
-        try:
-            writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
-        except Exception as e:
-            print(f"      Warning: Could not compress identical objects: {e}")
+        if profile['dedupe_objects']:
+            try:
+                writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+            except Exception as e:
+                print(f"      Warning: Could not compress identical objects: {e}")
         
         # Write compressed PDF
         with open(output_path, 'wb') as output_file:
@@ -132,9 +228,76 @@ def compress_pdf_basic(input_path, output_path):
         print(f"      Error with basic compression: {e}")
         return False
 
-def compress_pdf_file(input_path, output_path=None, quality=60):
+def _build_compression_methods(input_path, quality, profile_name, preferred=None, include_all=False):
+    """
+    Build the (name, callable) list of available backends for a profile
+    Each callable takes the output path to write to (and can be pickled for a process pool)
+    preferred moves a backend to the front, include_all ignores the profile's try_fallbacks
+    """
+    profile = get_compression_profile(profile_name)
+    available = {
+        'pikepdf': PIKEPDF_AVAILABLE,
+        'pypdf': PYPDF_AVAILABLE,
+        'basic': True,
+    }
+    backends = {
+        'pikepdf': partial(compress_pdf_pikepdf, input_path, quality=quality, profile=profile_name),
+        'pypdf': partial(compress_pdf_pypdf, input_path, profile=profile_name),
+        'basic': partial(compress_pdf_basic, input_path),
+    }
+    
+    names = [name for name in profile['backends'] if available[name]]
+    if preferred in names:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    if not profile['try_fallbacks'] and not include_all:
+        names = names[:1]
+    return [(name, backends[name]) for name in names]
+
+def _race_compression_methods(compression_methods, output_path):
+    """
+    Run backends concurrently into temporary files and keep the smallest output
+    pypdf and PyPDF2 are pure Python and hold the GIL, so each backend gets its own process
+    Returns the winning backend name, or None if every backend failed
+    """
+    candidates = {}
+    with ProcessPoolExecutor(max_workers=len(compression_methods)) as executor:
+        futures = {}
+        for method_name, compress_func in compression_methods:
+            candidate_path = f"{output_path}.{method_name}.tmp"
+            futures[executor.submit(compress_func, candidate_path)] = (method_name, candidate_path)
+        
+        for future in as_completed(futures):
+            method_name, candidate_path = futures[future]
+            try:
+                succeeded = future.result()
+            except Exception as e:
+                print(f"      ❌ {method_name} compression failed: {e}")
+                succeeded = False
+            
+            if succeeded and os.path.exists(candidate_path):
+                candidates[method_name] = candidate_path
+            elif os.path.exists(candidate_path):
+                os.remove(candidate_path)
+    
+    if not candidates:
+        return None
+    
+    winner = min(candidates, key=lambda name: os.path.getsize(candidates[name]))
+    for method_name, candidate_path in candidates.items():
+        print(f"      🏁 {method_name}: {get_file_size_kb(candidate_path):.2f} KB")
+        if method_name == winner:
+            os.replace(candidate_path, output_path)
+        else:
+            os.remove(candidate_path)
+    return winner
+
+def compress_pdf_file(input_path, output_path=None, quality=60, profile=None, stats=None, selection=None):
     """
-    Compress a PDF file using the best available method
+    Compress a PDF file using the backends selected by the compression profile
+    If a stats dict is given (see new_compression_stats), the cost of this pass is added to it
+    If a backend selection is given (see backend_selection.BackendSelector.for_document), backends
+    are raced until a winner is known for the document or its class, then only the winner is used
     Returns: (success, output_path, compression_ratio)
     """
     if output_path is None:
@@ -142,40 +305,74 @@ def compress_pdf_file(input_path, output_path=None, quality=60):
         output_path = f"{base}{ext}"
     
     original_size = get_file_size_kb(input_path)
-    print(f"      Compressing PDF: {os.path.basename(input_path)} ({original_size:.2f} KB)")
+    started = time.perf_counter()
+    success, result_path, compression_ratio, method_name, raced = _compress_pdf_file(
+        input_path, output_path, quality, profile, selection)
     
-    # Try compression methods in order of preference
-    compression_methods = []
+    if stats is not None:
+        stats['passes'] += 1
+        stats['seconds'] += time.perf_counter() - started
+        if raced:
+            stats['races'] += 1
+        if method_name:
+            stats['backends'][method_name] = stats['backends'].get(method_name, 0) + 1
+        if success:
+            stats['successes'] += 1
+            stats['kb_saved'] += original_size - get_file_size_kb(result_path)
     
-    if PIKEPDF_AVAILABLE:
-        compression_methods.append(("pikepdf", lambda: compress_pdf_pikepdf(input_path, output_path, quality)))
+    return success, result_path, compression_ratio
+
+def _accept_compressed(input_path, output_path, original_size, method_name):
+    """Keep the compressed output only if it gives a worthwhile reduction"""
+    compressed_size = get_file_size_kb(output_path)
+    compression_ratio = (original_size - compressed_size) / original_size * 100
     
-    if PYPDF_AVAILABLE:
-        compression_methods.append(("pypdf", lambda: compress_pdf_pypdf(input_path, output_path)))
+    print(f"      ✅ Compressed using {method_name}: {compressed_size:.2f} KB "
+          f"({compression_ratio:.1f}% reduction)")
     
-    compression_methods.append(("basic", lambda: compress_pdf_basic(input_path, output_path)))
+    # If compression didn't help much, use original
+    if compression_ratio < 5:  # Less than 5% reduction
+        print(f"      📝 Compression ratio too low, keeping original")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return False, input_path, 0
+    
+    return True, output_path, compression_ratio
+
+def _compress_pdf_file(input_path, output_path, quality, profile, selection=None):
+    """
+    Run the profile's backends until one produces a worthwhile reduction
+    Returns: (success, output_path, compression_ratio, backend_used, raced)
+    """
+    original_size = get_file_size_kb(input_path)
+    print(f"      Compressing PDF: {os.path.basename(input_path)} ({original_size:.2f} KB)")
+    
+    preferred = selection.choose() if selection is not None else None
+    
+    # Race every available backend while no winner is known yet
+    if selection is not None and preferred is None:
+        compression_methods = _build_compression_methods(input_path, quality, profile, include_all=True)
+        if len(compression_methods) > 1:
+            print(f"      🏁 Racing {', '.join(name for name, _ in compression_methods)}...")
+            winner = _race_compression_methods(compression_methods, output_path)
+            if winner is None:
+                print(f"      ❌ All compression methods failed")
+                return False, input_path, 0, None, True
+            
+            selection.record(winner)
+            return _accept_compressed(input_path, output_path, original_size, winner) + (winner, True)
+    
+    # Try compression methods in order of preference (the learned winner first)
+    compression_methods = _build_compression_methods(input_path, quality, profile, preferred)
     
     for method_name, compress_func in compression_methods:
         try:
-            if compress_func():
-                compressed_size = get_file_size_kb(output_path)
-                compression_ratio = (original_size - compressed_size) / original_size * 100
-                
-                print(f"      ✅ Compressed using {method_name}: {compressed_size:.2f} KB "
-                      f"({compression_ratio:.1f}% reduction)")
-                
-                # If compression didn't help much, use original
-                if compression_ratio < 5:  # Less than 5% reduction
-                    print(f"      📝 Compression ratio too low, keeping original")
-                    if os.path.exists(output_path):
-                        os.remove(output_path)
-                    return False, input_path, 0
-                
-                return True, output_path, compression_ratio
+            if compress_func(output_path):
+                return _accept_compressed(input_path, output_path, original_size, method_name) + (method_name, False)
                 
         except Exception as e:
             print(f"      ❌ {method_name} compression failed: {e}")
             continue
     
     print(f"      ❌ All compression methods failed")
-    return False, input_path, 0 
\ No newline at end of file
+    return False, input_path, 0, None, False
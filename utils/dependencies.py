@@ -2,24 +2,40 @@
 Dependency management for PDF processing libraries
 """
 
+import importlib
+import importlib.util
+from functools import lru_cache
+
+def is_module_installed(module_name):
+    """Check if a module can be imported without actually importing it"""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+@lru_cache(maxsize=None)
+def load_module(module_name):
+    """Import an optional dependency on first use (cached after the first call)"""
+    return importlib.import_module(module_name)
+
+# Availability is checked with find_spec so startup never pays for importing
+# heavy optional libraries; they are imported by load_module when first used.
+
 # PDF Compression libraries
-try:
-    import pikepdf
-    PIKEPDF_AVAILABLE = True
-except ImportError:
-    PIKEPDF_AVAILABLE = False
-
-try:
-    from pypdf import PdfWriter, PdfReader
-    PYPDF_AVAILABLE = True
-except ImportError:
-    PYPDF_AVAILABLE = False
-
-try:
-    import Crypto
-    PYCRYPTODOME_AVAILABLE = True
-except ImportError:
-    PYCRYPTODOME_AVAILABLE = False
+PIKEPDF_AVAILABLE = is_module_installed('pikepdf')
+PYPDF_AVAILABLE = is_module_installed('pypdf')
+
+# Font subsetting for the chunk-writing stage
+FONTTOOLS_AVAILABLE = is_module_installed('fontTools')
+
+# Encryption support
+PYCRYPTODOME_AVAILABLE = is_module_installed('Crypto')
+
+# Object storage upload
+BOTO3_AVAILABLE = is_module_installed('boto3')
+
+# Filesystem events for watch mode
+WATCHDOG_AVAILABLE = is_module_installed('watchdog')
 
 def print_dependency_status():
     """Print the status of all dependencies"""
@@ -36,12 +52,35 @@ def print_dependency_status():
     
     print("   ✅ PyPDF2 (Basic compression - always available)")
     
+    print("\n✂️  Chunk Optimization:")
+    if PIKEPDF_AVAILABLE:
+        print("   ✅ pikepdf (Drops unused resources and duplicate objects from each chunk)")
+    else:
+        print("   ❌ pikepdf (Chunks keep every resource their pages point at)")
+    if FONTTOOLS_AVAILABLE:
+        print("   ✅ fontTools (Subsets embedded fonts to the glyphs each chunk uses)")
+    else:
+        print("   ❌ fontTools (Not installed - run: pip install fonttools)")
+    
     print("\n🔐 Encryption Support:")
     if PYCRYPTODOME_AVAILABLE:
         print("   ✅ PyCryptodome (Can handle encrypted PDFs)")
     else:
         print("   ❌ PyCryptodome (Not installed - run: pip install pycryptodome)")
         print("   ⚠️  Encrypted PDFs will be skipped without this library")
+    
+    print("\n☁️  Object Storage Upload:")
+    if BOTO3_AVAILABLE:
+        print("   ✅ boto3 (Can upload chunks to S3-compatible storage)")
+    else:
+        print("   ❌ boto3 (Not installed - run: pip install boto3)")
+    
+    print("\n👀 Watch Mode:")
+    if WATCHDOG_AVAILABLE:
+        print("   ✅ watchdog (Filesystem events for --watch)")
+    else:
+        print("   ❌ watchdog (Not installed - run: pip install watchdog)")
+        print("   ⚠️  --watch will poll the files directory instead")
 
 def get_available_compression_methods():
     """Get list of available compression methods in order of preference"""
@@ -1,9 +1,132 @@
 """
 PDF encryption handling utilities
 """
+import os
+import json
+import atexit
+import shutil
+import tempfile
+import threading
 import PyPDF2
 from .dependencies import PYCRYPTODOME_AVAILABLE
 
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Passwords tried after every configured source
+COMMON_PASSWORDS = ['', 'password', '123456', 'admin', 'user']
+
+SPOOL_DIR_PREFIX = '.decrypted_'
+# Held locked by the owning process for as long as its spool directory is in use
+SPOOL_LOCK_NAME = '.owner.lock'
+
+_spool_dirs = {}
+_spool_dirs_lock = threading.Lock()
+
+def env_password_source(variable='CHONKIE_PDF_PASSWORDS'):
+    """Password source reading candidates from an environment variable (os.pathsep separated)"""
+    def source(pdf_path):
+        value = os.environ.get(variable, '')
+        return [password for password in value.split(os.pathsep) if password]
+    return source
+
+def file_password_source(passwords_file):
+    """
+    Password source reading a text file with one password per line
+    Lines of the form 'name.pdf: password' only apply to that file
+    """
+    def source(pdf_path):
+        if not os.path.exists(passwords_file):
+            return []
+
+        filename = os.path.basename(pdf_path)
+        specific, general = [], []
+        with open(passwords_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.rstrip('\n')
+                if not line or line.startswith('#'):
+                    continue
+                name, sep, password = line.partition(': ')
+                if sep and name.lower().endswith('.pdf'):
+                    if name == filename:
+                        specific.append(password)
+                else:
+                    general.append(line)
+        return specific + general
+    return source
+
+def keyring_password_source(keyring_file):
+    """
+    Password source backed by a JSON keyring stand-in mapping file names to passwords
+    Values may be a single password or a list of passwords
+    """
+    def source(pdf_path):
+        if not os.path.exists(keyring_file):
+            return []
+
+        with open(keyring_file, 'r', encoding='utf-8') as file:
+            entries = json.load(file)
+        passwords = entries.get(os.path.basename(pdf_path), [])
+        return [passwords] if isinstance(passwords, str) else list(passwords)
+    return source
+
+class PasswordProvider:
+    """
+    Supplies candidate passwords for encrypted PDFs from pluggable sources
+    The password that worked is cached per file so later opens try it first
+    """
+
+    def __init__(self, sources=None, include_common=True):
+        self.sources = list(sources or [])
+        self.include_common = include_common
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cache_key(self, pdf_path):
+        stat = os.stat(pdf_path)
+        return os.path.abspath(pdf_path), stat.st_size, stat.st_mtime
+
+    def candidates(self, pdf_path):
+        """Yield candidate passwords for a file, cached password first, without repeats"""
+        seen = set()
+
+        with self._lock:
+            cached = self._cache.get(self._cache_key(pdf_path))
+        if cached is not None:
+            seen.add(cached)
+            yield cached
+
+        sources = self.sources + ([lambda path: COMMON_PASSWORDS] if self.include_common else [])
+        for source in sources:
+            try:
+                passwords = source(pdf_path)
+            except Exception as e:
+                print(f"      Warning: Password source failed: {e}")
+                continue
+            for password in passwords:
+                if password not in seen:
+                    seen.add(password)
+                    yield password
+
+    def remember(self, pdf_path, password):
+        """Cache the password that decrypted a file"""
+        with self._lock:
+            self._cache[self._cache_key(pdf_path)] = password
+
+def default_password_provider():
+    """
+    Build a password provider from the environment:
+    CHONKIE_PDF_PASSWORDS, CHONKIE_PDF_PASSWORD_FILE and CHONKIE_PDF_KEYRING
+    """
+    sources = [env_password_source()]
+    if os.environ.get('CHONKIE_PDF_PASSWORD_FILE'):
+        sources.append(file_password_source(os.environ['CHONKIE_PDF_PASSWORD_FILE']))
+    if os.environ.get('CHONKIE_PDF_KEYRING'):
+        sources.append(keyring_password_source(os.environ['CHONKIE_PDF_KEYRING']))
+    return PasswordProvider(sources)
+
 def is_pdf_encrypted(pdf_path):
     """Check if a PDF file is encrypted"""
     try:
@@ -13,33 +136,129 @@ def is_pdf_encrypted(pdf_path):
     except Exception:
         return False
 
-def handle_encrypted_pdf(pdf_path):
+def _decrypt_reader(pdf_reader, pdf_path, password_provider):
+    """Try the provider's passwords on an encrypted reader, returns True on success"""
+    for password in password_provider.candidates(pdf_path):
+        try:
+            if pdf_reader.decrypt(password):
+                password_provider.remember(pdf_path, password)
+                print(f"      ✅ Successfully decrypted PDF")
+                return True
+        except Exception:
+            continue
+
+    print(f"      ❌ PDF is encrypted and requires a password")
+    return False
+
+def handle_encrypted_pdf(pdf_path, password_provider=None):
     """Try to handle encrypted PDF files"""
+    if password_provider is None:
+        password_provider = PasswordProvider()
+
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            if pdf_reader.is_encrypted:
-                # Try common passwords
-                common_passwords = ['', 'password', '123456', 'admin', 'user']
-                
-                for password in common_passwords:
-                    try:
-                        if pdf_reader.decrypt(password):
-                            print(f"      ✅ Successfully decrypted with password: '{password}'")
-                            return pdf_reader
-                    except Exception:
-                        continue
-                
-                print(f"      ❌ PDF is encrypted and requires a password")
-                return None
-            else:
+        # Read the whole file into memory so the reader stays usable after returning
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+
+        if pdf_reader.is_encrypted:
+            if _decrypt_reader(pdf_reader, pdf_path, password_provider):
                 return pdf_reader
-                
+            return None
+        else:
+            return pdf_reader
+
     except Exception as e:
         print(f"      ❌ Error reading PDF: {e}")
         return None
 
+def _try_lock(lock_file):
+    """Take a non-blocking exclusive lock on an open file, returns False if another process holds it"""
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _remove_stale_spool_dirs(base_dir):
+    """
+    Remove spool directories left behind by runs that were killed
+    The operating system drops a dead process's lock, so any directory whose lock can be taken is stale
+    """
+    for name in os.listdir(base_dir):
+        spool_dir = os.path.join(base_dir, name)
+        if not name.startswith(SPOOL_DIR_PREFIX) or not os.path.isdir(spool_dir):
+            continue
+        try:
+            lock_file = open(os.path.join(spool_dir, SPOOL_LOCK_NAME), 'a+b')
+        except OSError:
+            # No lock yet (still being created) or not ours to touch
+            continue
+        with lock_file:
+            if not _try_lock(lock_file):
+                continue
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def _release_spool_dir(spool_dir, lock_file):
+    lock_file.close()
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+def private_spool_dir(base_dir=None):
+    """
+    Get this process's private (0700) directory for decrypted spools under base_dir
+    (the system temp directory by default). It is removed at exit, and directories
+    left by killed runs are removed the next time one is created in base_dir.
+    """
+    base_dir = os.path.abspath(base_dir or tempfile.gettempdir())
+    with _spool_dirs_lock:
+        if base_dir not in _spool_dirs:
+            _remove_stale_spool_dirs(base_dir)
+            spool_dir = tempfile.mkdtemp(prefix=f"{SPOOL_DIR_PREFIX}{os.getpid()}_", dir=base_dir)
+            lock_file = open(os.path.join(spool_dir, SPOOL_LOCK_NAME), 'a+b')
+            _try_lock(lock_file)
+            atexit.register(_release_spool_dir, spool_dir, lock_file)
+            _spool_dirs[base_dir] = spool_dir
+        return _spool_dirs[base_dir]
+
+def spool_decrypted_pdf(pdf_path, password_provider=None, spool_dir=None):
+    """
+    Decrypt a PDF once and write a plaintext copy to a temporary file
+    Later passes (page counting, chunking, compression) read the spool instead of
+    re-running key derivation. The copy goes into a private spool directory
+    (see private_spool_dir); the caller is responsible for removing the spool.
+    Returns: path of the spooled copy, or None if the PDF could not be decrypted
+    """
+    if spool_dir is None:
+        spool_dir = private_spool_dir()
+    
+    pdf_reader = handle_encrypted_pdf(pdf_path, password_provider)
+    if pdf_reader is None:
+        return None
+
+    spool_path = None
+    try:
+        writer = PyPDF2.PdfWriter()
+        for page in pdf_reader.pages:
+            writer.add_page(page)
+        metadata = pdf_reader.metadata or {}
+        if metadata:
+            writer.add_metadata(metadata)
+        if '/Producer' not in metadata:
+            # Keep the spool's metadata the original's, so it classifies like the original (see classify_document)
+            del writer._info.get_object()['/Producer']
+
+        fd, spool_path = tempfile.mkstemp(prefix='decrypted_', suffix='.pdf', dir=spool_dir)
+        with os.fdopen(fd, 'wb') as spool_file:
+            writer.write(spool_file)
+        return spool_path
+
+    except Exception as e:
+        print(f"      ❌ Error spooling decrypted PDF: {e}")
+        if spool_path and os.path.exists(spool_path):
+            os.remove(spool_path)
+        return None
+
 def check_encryption_support():
     """Check if encryption is supported"""
-    return PYCRYPTODOME_AVAILABLE 
\ No newline at end of file
+    return PYCRYPTODOME_AVAILABLE
@@ -0,0 +1,200 @@
+"""
+Live run metrics
+
+RunMetrics is updated from the processing loop and can be exposed while the
+run is in progress, either as a Prometheus text endpoint served over HTTP or
+as a JSON status file that is rewritten periodically.
+"""
+import os
+import json
+import threading
+import time
+
+class RunMetrics:
+    """Thread-safe counters describing the progress of a batch or watch run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.active_workers = 0
+        self.pages_done = 0
+        self.bytes_total = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compression_passes = 0
+        self.compression_successes = 0
+        # filename -> input size and what its committed chunks have already added
+        self._in_progress = {}
+
+    def add_files(self, count, total_bytes=0):
+        """Register files that are waiting to be processed"""
+        with self._lock:
+            self.files_total += count
+            self.bytes_total += total_bytes
+
+    def file_started(self, filename=None, file_bytes=0):
+        with self._lock:
+            self.active_workers += 1
+            if filename is not None:
+                self._in_progress[filename] = {'file_bytes': file_bytes, 'pages': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def chunk_committed(self, filename, chunk, total_pages):
+        """Count a committed chunk's pages and bytes while its file is still being chunked"""
+        with self._lock:
+            progress = self._in_progress.get(filename)
+            if progress is None or not total_pages:
+                return
+            # Input bytes are attributed to chunks in proportion to their pages
+            bytes_in = int(progress['file_bytes'] * chunk['page_count'] / total_pages)
+            bytes_out = int(chunk['size_kb'] * 1024)
+            progress['pages'] += chunk['page_count']
+            progress['bytes_in'] += bytes_in
+            progress['bytes_out'] += bytes_out
+            self.pages_done += chunk['page_count']
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def file_finished(self, file_info):
+        """Record a processed file from its chunking info dict, adding what its committed chunks did not cover"""
+        compression_stats = file_info.get('compression') or {}
+        with self._lock:
+            progress = self._in_progress.pop(file_info['filename'], {'pages': 0, 'bytes_in': 0, 'bytes_out': 0})
+            self.active_workers -= 1
+            self.files_done += 1
+            file_bytes = int(file_info['original_size'] * 1024)
+            if file_info['chunks']:
+                # Counters never go down, so estimates that overshot are left as they are
+                self.pages_done += max(file_info['total_pages'] - progress['pages'], 0)
+                self.bytes_in += max(file_bytes - progress['bytes_in'], 0)
+                chunk_bytes = int(sum(chunk['size_kb'] for chunk in file_info['chunks']) * 1024)
+                self.bytes_out += max(chunk_bytes - progress['bytes_out'], 0)
+            else:
+                # Chunks committed before the failure stay counted; the rest of the file will never be processed
+                self.files_failed += 1
+                self.bytes_total -= max(file_bytes - progress['bytes_in'], 0)
+            self.compression_passes += compression_stats.get('passes', 0)
+            self.compression_successes += compression_stats.get('successes', 0)
+
+    def snapshot(self):
+        """Current metrics as a flat dict"""
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            bytes_rate = self.bytes_in / elapsed if elapsed > 0 else 0
+            remaining_bytes = max(self.bytes_total - self.bytes_in, 0)
+            files_remaining = self.files_total - self.files_done
+            if files_remaining == 0:
+                eta = 0
+            elif bytes_rate > 0:
+                eta = remaining_bytes / bytes_rate
+            else:
+                # Unknown until the first chunk has been committed
+                eta = -1
+            return {
+                'uptime_seconds': elapsed,
+                'files_total': self.files_total,
+                'files_done': self.files_done,
+                'files_failed': self.files_failed,
+                'files_remaining': files_remaining,
+                'active_workers': self.active_workers,
+                'pages_done': self.pages_done,
+                'pages_per_second': self.pages_done / elapsed if elapsed > 0 else 0,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'compression_passes': self.compression_passes,
+                'compression_hit_rate': (self.compression_successes / self.compression_passes
+                                         if self.compression_passes else 0),
+                'eta_seconds': eta,
+            }
+
+# name in snapshot -> (Prometheus type, help text)
+PROMETHEUS_METRICS = {
+    'uptime_seconds': ('gauge', 'Seconds since the run started'),
+    'files_total': ('counter', 'PDF files queued for processing'),
+    'files_done': ('counter', 'PDF files processed'),
+    'files_failed': ('counter', 'PDF files that produced no chunks'),
+    'files_remaining': ('gauge', 'PDF files still to process'),
+    'active_workers': ('gauge', 'Files currently being processed'),
+    'pages_done': ('counter', 'Pages in committed chunks and processed files'),
+    'pages_per_second': ('gauge', 'Average pages processed per second'),
+    'bytes_in': ('counter', 'Bytes of input PDFs processed'),
+    'bytes_out': ('counter', 'Bytes of chunks written'),
+    'compression_passes': ('counter', 'Compression passes run'),
+    'compression_hit_rate': ('gauge', 'Fraction of compression passes whose output was kept'),
+    'eta_seconds': ('gauge', 'Estimated seconds until queued files are done (-1 if unknown)'),
+}
+
+def format_prometheus(snapshot):
+    """Render a metrics snapshot in the Prometheus text exposition format"""
+    lines = []
+    for name, (metric_type, help_text) in PROMETHEUS_METRICS.items():
+        metric_name = f"chonkie_{name}"
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        lines.append(f"{metric_name} {snapshot[name]}")
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server(metrics, port, host='127.0.0.1'):
+    """Serve /metrics in Prometheus text format from a background thread, returns the server"""
+    # Imported here so runs without --metrics-port do not pay for it at startup
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ['/', '/metrics']:
+                self.send_error(404)
+                return
+            body = format_prometheus(metrics.snapshot()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrapes out of the console output
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"📈 Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def write_status_file(metrics, status_path):
+    """Atomically rewrite the JSON status file with the current metrics"""
+    temp_path = f"{status_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as status_file:
+        json.dump(metrics.snapshot(), status_file, indent=2)
+    os.replace(temp_path, status_path)
+
+class StatusFileWriter:
+    """Rewrite a JSON status file every interval seconds until stopped"""
+
+    def __init__(self, metrics, status_path, interval=5.0):
+        self.metrics = metrics
+        self.status_path = status_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='status-file', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print(f"📈 Status file: {self.status_path} (every {self.interval:g}s)")
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                write_status_file(self.metrics, self.status_path)
+            except OSError as e:
+                print(f"   ⚠️  Could not write status file: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop the writer and write the final state"""
+        self._stop.set()
+        self._thread.join()
+        write_status_file(self.metrics, self.status_path)
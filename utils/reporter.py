@@ -4,7 +4,8 @@ Report generation utilities for PDF chunking
 import os
 from .dependencies import get_available_compression_methods
 
-def generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_time, compression_enabled=True):
+def generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_time, compression_enabled=True,
+                    compression_profile=None, upload_summary=None):
     """Generate a detailed report of the chunking process"""
     report_path = os.path.join(chunks_dir, "chunking_report.txt")
     
@@ -26,6 +27,8 @@ def generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_ti
         report.write(f"Processing Time: {(end_time - start_time).total_seconds():.2f} seconds\n")
         report.write(f"Maximum Chunk Size: {max_size_kb} KB\n")
         report.write(f"Compression Enabled: {'Yes' if compression_enabled else 'No'}\n")
+        if compression_enabled and compression_profile:
+            report.write(f"Compression Profile: {compression_profile}\n")
         
         # Report available compression libraries
         compression_libs = get_available_compression_methods()
@@ -39,6 +42,17 @@ def generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_ti
         report.write(f"Total Chunks Size: {total_chunks_size:.2f} KB\n")
         report.write(f"Size Difference: {abs(total_original_size - total_chunks_size):.2f} KB\n\n")
         
+        if upload_summary:
+            report.write("UPLOADS:\n")
+            report.write("-" * 40 + "\n")
+            report.write(f"Destination: {upload_summary['destination']}\n")
+            report.write(f"Uploaded Objects: {upload_summary['uploaded']} "
+                         f"({upload_summary['failed']} failed, {upload_summary['retries']} retries)\n")
+            report.write(f"Uploaded Size: {upload_summary['uploaded_kb']:.2f} KB\n")
+            report.write(f"Upload Throughput: {upload_summary['throughput_kb_s']:.2f} KB/s\n")
+            report.write(f"Upload Queue Depth: max {upload_summary['max_queue_depth']}, "
+                         f"avg {upload_summary['avg_queue_depth']:.1f}\n\n")
+        
         report.write("DETAILED BREAKDOWN:\n")
         report.write("=" * 80 + "\n\n")
         
@@ -47,14 +61,24 @@ def generate_report(all_chunks_info, chunks_dir, max_size_kb, start_time, end_ti
             report.write(f"   Original Size: {file_info['original_size']:.2f} KB\n")
             report.write(f"   Total Pages: {file_info['total_pages']}\n")
             report.write(f"   Chunks Created: {len(file_info['chunks'])}\n")
+            
+            compression_stats = file_info.get('compression')
+            if compression_enabled and compression_stats and compression_stats['passes']:
+                report.write(f"   Compression Cost ({compression_stats['profile']}): "
+                           f"{compression_stats['passes']} passes, {compression_stats['seconds']:.2f} seconds, "
+                           f"{compression_stats['successes']} kept, {compression_stats['kb_saved']:.2f} KB saved\n")
+                if compression_stats.get('backends'):
+                    backends_used = ', '.join(f"{name} x{count}" for name, count in compression_stats['backends'].items())
+                    report.write(f"   Compression Backends: {backends_used} ({compression_stats['races']} races)\n")
             report.write(f"   Status: {file_info['status']}\n\n")
             
             if file_info['chunks']:
                 report.write("   CHUNKS:\n")
                 for chunk in file_info['chunks']:
                     pages_range = f"{min(chunk['pages'])}-{max(chunk['pages'])}" if len(chunk['pages']) > 1 else str(chunk['pages'][0])
+                    upload_error = f" - UPLOAD FAILED: {chunk['upload_error']}" if chunk.get('upload_error') else ""
                     report.write(f"   • {chunk['filename']}: {chunk['size_kb']:.2f} KB, "
-                               f"Pages {pages_range} ({chunk['page_count']} pages)\n")
+                               f"Pages {pages_range} ({chunk['page_count']} pages){upload_error}\n")
                 report.write("\n")
             
             report.write("-" * 80 + "\n\n")
@@ -0,0 +1,362 @@
+"""
+Output sinks for committed PDF chunks
+
+The chunker sizes chunks in memory; once a chunk is final its bytes are
+handed to a sink, which writes them once to their destination. Only the
+directory sink puts chunk files on disk.
+"""
+import io
+import os
+import abc
+import random
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from .dependencies import BOTO3_AVAILABLE, load_module
+from .file_utils import create_chunk_directory
+
+REPORT_MEMBER_NAME = "chunking_report.txt"
+
+def _document_name(filename):
+    """Name of the per-document folder/prefix used for a PDF's chunks"""
+    return filename.replace('.pdf', '')
+
+def _read_report(report_path):
+    with open(report_path, 'rb') as report_file:
+        return report_file.read()
+
+class DirectorySink:
+    """Write chunks into a per-document subdirectory of chunks_dir (the default)"""
+
+    def __init__(self, chunks_dir):
+        self.chunks_dir = chunks_dir
+
+    def begin_document(self, filename):
+        create_chunk_directory(self.chunks_dir, filename)
+
+    def commit_chunk(self, filename, chunk_name, data):
+        """Write a final chunk's bytes, returns the chunk's location"""
+        chunk_path = os.path.join(create_chunk_directory(self.chunks_dir, filename), chunk_name)
+        with open(chunk_path, 'wb') as chunk_file:
+            chunk_file.write(data)
+        return chunk_path
+
+    def end_document(self, filename):
+        pass
+
+    def add_report(self, report_path):
+        pass
+
+    def flush(self, locations=None):
+        """Wait for pending writes, optionally only those of the given locations (synchronous sinks have none)"""
+        pass
+
+    def remove(self, location):
+        """Delete a previously committed chunk (e.g. a stale chunk of a changed file), returns True if it was removed"""
+        if not os.path.isfile(location):
+            return False
+        os.remove(location)
+        return True
+
+    def failures(self):
+        """Locations of committed chunks that could not be stored, mapped to the error"""
+        return {}
+
+    def summary(self):
+        """Sink-specific statistics for the report, or None"""
+        return None
+
+    def close(self):
+        pass
+
+class _MemberSink(abc.ABC):
+    """Base for sinks that store every chunk as a 'document/chunk.pdf' member of a single destination"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def begin_document(self, filename):
+        pass
+
+    def commit_chunk(self, filename, chunk_name, data):
+        member_name = f"{_document_name(filename)}/{chunk_name}"
+        with self._lock:
+            return self._write_member(member_name, data)
+
+    def end_document(self, filename):
+        pass
+
+    def add_report(self, report_path):
+        data = _read_report(report_path)
+        with self._lock:
+            self._write_member(REPORT_MEMBER_NAME, data)
+
+    def flush(self, locations=None):
+        pass
+
+    def remove(self, location):
+        # Streamed archive members cannot be taken back out
+        return False
+
+    def failures(self):
+        return {}
+
+    def summary(self):
+        return None
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def _write_member(self, member_name, data):
+        """Store one member's bytes, returns its location"""
+
+class ZipSink(_MemberSink):
+    """
+    Stream chunks into a ZIP archive (a path or a writable file object)
+    PDF streams are already compressed, so members are stored by default
+    """
+
+    def __init__(self, archive, compression=zipfile.ZIP_STORED):
+        super().__init__()
+        self.archive = archive
+        self._zip = zipfile.ZipFile(archive, 'w', compression=compression)
+
+    def _write_member(self, member_name, data):
+        # A bare name would be stamped 1980-01-01, match TarSink and use the commit time
+        info = zipfile.ZipInfo(member_name, date_time=time.localtime()[:6])
+        info.compress_type = self._zip.compression
+        info.external_attr = 0o644 << 16
+        with self._zip.open(info, 'w') as member:
+            member.write(data)
+        return f"{self.archive}::{member_name}" if isinstance(self.archive, str) else member_name
+
+    def close(self):
+        self._zip.close()
+
+class TarSink(_MemberSink):
+    """Stream chunks into a TAR archive (a path or a writable file object, written as a non-seekable stream)"""
+
+    def __init__(self, archive, compression=''):
+        super().__init__()
+        self.archive = archive
+        mode = f"w|{compression}"
+        if isinstance(archive, str):
+            self._tar = tarfile.open(archive, mode)
+        else:
+            self._tar = tarfile.open(fileobj=archive, mode=mode)
+
+    def _write_member(self, member_name, data):
+        member = tarfile.TarInfo(member_name)
+        member.size = len(data)
+        member.mtime = int(time.time())
+        self._tar.addfile(member, io.BytesIO(data))
+        return f"{self.archive}::{member_name}" if isinstance(self.archive, str) else member_name
+
+    def close(self):
+        self._tar.close()
+
+class CallbackSink(_MemberSink):
+    """
+    Hand every committed chunk to a callback as bytes
+    callback(member_name, data) where member_name is 'document/chunk.pdf' or the report name
+    """
+
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def _write_member(self, member_name, data):
+        self.callback(member_name, data)
+        return member_name
+
+class S3Sink(_MemberSink):
+    """
+    Upload committed chunks to an S3-compatible object store while chunking continues
+    Uploads run on a bounded thread pool sharing one connection pool; chunks above
+    multipart_threshold_mb use multipart uploads. Failed uploads are retried with
+    exponential backoff starting at retry_delay seconds; uploads that still fail are
+    reported by failures(). Pass endpoint_url for MinIO or a ready-made client (e.g. under moto).
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, max_workers=8, max_queue=32,
+                 multipart_threshold_mb=8, multipart_chunksize_mb=8, multipart_concurrency=2,
+                 max_retries=5, retry_delay=1.0, client=None):
+        if client is None and not BOTO3_AVAILABLE:
+            raise ValueError("boto3 is required for the s3 output format (pip install boto3)")
+        super().__init__()
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        if client is None:
+            client = load_module('boto3').client(
+                's3', endpoint_url=endpoint_url,
+                config=load_module('botocore.config').Config(max_pool_connections=max_workers * multipart_concurrency))
+        self.client = client
+        # Multipart settings; an injected client without boto3 gets the client's own defaults
+        self.transfer_options = {}
+        if BOTO3_AVAILABLE:
+            self.transfer_options['Config'] = load_module('boto3.s3.transfer').TransferConfig(
+                multipart_threshold=int(multipart_threshold_mb * 1024 * 1024),
+                multipart_chunksize=int(multipart_chunksize_mb * 1024 * 1024),
+                max_concurrency=multipart_concurrency,
+                use_threads=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-upload')
+        # Backpressure: chunking blocks once max_queue uploads are pending
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._futures = {}
+        self._failures = {}
+        self._stats = {
+            'uploaded': 0,
+            'failed': 0,
+            'retries': 0,
+            'bytes': 0,
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'submitted': 0,
+            'depth_total': 0,
+            'started': None,
+            'finished': None,
+        }
+
+    def _key(self, member_name):
+        return f"{self.prefix}/{member_name}" if self.prefix else member_name
+
+    def _location(self, member_name):
+        return f"s3://{self.bucket}/{self._key(member_name)}"
+
+    def _upload(self, data, member_name):
+        size = len(data)
+        location = self._location(member_name)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.client.upload_fileobj(io.BytesIO(data), self.bucket, self._key(member_name),
+                                               **self.transfer_options)
+                    with self._lock:
+                        self._stats['uploaded'] += 1
+                        self._stats['bytes'] += size
+                        # A later upload of the same key (e.g. a changed file) replaces an earlier failure
+                        self._failures.pop(location, None)
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        print(f"      ❌ Upload of {member_name} failed: {e}")
+                        with self._lock:
+                            self._stats['failed'] += 1
+                            self._failures[location] = str(e)
+                        return
+                    with self._lock:
+                        self._stats['retries'] += 1
+                    time.sleep(min(self.retry_delay * 2 ** attempt, 30) * (0.5 + random.random() / 2))
+        finally:
+            with self._lock:
+                self._stats['queue_depth'] -= 1
+                self._stats['finished'] = time.perf_counter()
+            self._slots.release()
+
+    def _submit(self, data, member_name):
+        self._slots.acquire()
+        with self._lock:
+            if self._stats['started'] is None:
+                self._stats['started'] = time.perf_counter()
+            self._stats['queue_depth'] += 1
+            self._stats['submitted'] += 1
+            self._stats['depth_total'] += self._stats['queue_depth']
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._stats['queue_depth'])
+        future = self._executor.submit(self._upload, data, member_name)
+        with self._lock:
+            self._futures[self._location(member_name)] = future
+
+    def _write_member(self, member_name, data):
+        self._submit(data, member_name)
+        return self._location(member_name)
+
+    def commit_chunk(self, filename, chunk_name, data):
+        # Not under the lock: a full upload queue blocks this caller only
+        return self._write_member(f"{_document_name(filename)}/{chunk_name}", data)
+
+    def add_report(self, report_path):
+        self._write_member(REPORT_MEMBER_NAME, _read_report(report_path))
+
+    def flush(self, locations=None):
+        with self._lock:
+            if locations is None:
+                futures = list(self._futures.values())
+            else:
+                futures = [self._futures[location] for location in locations if location in self._futures]
+        for future in futures:
+            future.result()
+        with self._lock:
+            for location, future in list(self._futures.items()):
+                if future.done():
+                    del self._futures[location]
+
+    def remove(self, location):
+        """Delete a previously uploaded object of this bucket, returns True if it was deleted"""
+        bucket_prefix = f"s3://{self.bucket}/"
+        if not location.startswith(bucket_prefix):
+            return False
+        # An upload of the same key still in flight would recreate the object
+        self.flush([location])
+        key = location[len(bucket_prefix):]
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.client.delete_object(Bucket=self.bucket, Key=key)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"      ❌ Could not delete stale object {location}: {e}")
+                    return False
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(min(self.retry_delay * 2 ** attempt, 30) * (0.5 + random.random() / 2))
+        with self._lock:
+            self._failures.pop(location, None)
+        return True
+
+    def failures(self):
+        with self._lock:
+            return dict(self._failures)
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self._stats)
+        elapsed = (stats['finished'] - stats['started']) if stats['started'] and stats['finished'] else 0
+        return {
+            'destination': f"s3://{self.bucket}/{self.prefix}",
+            'uploaded': stats['uploaded'],
+            'failed': stats['failed'],
+            'retries': stats['retries'],
+            'uploaded_kb': stats['bytes'] / 1024,
+            'throughput_kb_s': stats['bytes'] / 1024 / elapsed if elapsed > 0 else 0,
+            'queue_depth': stats['queue_depth'],
+            'max_queue_depth': stats['max_queue_depth'],
+            'avg_queue_depth': stats['depth_total'] / stats['submitted'] if stats['submitted'] else 0,
+        }
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+OUTPUT_FORMATS = ['directory', 'zip', 'tar'] + (['s3'] if BOTO3_AVAILABLE else [])
+
+def create_sink(output_format, chunks_dir, bucket=None, prefix='', endpoint_url=None):
+    """
+    Create the sink for an output format, archives are written into chunks_dir
+    The s3 format uploads to bucket/prefix (endpoint_url selects an S3-compatible store such as MinIO)
+    """
+    if output_format == 'directory':
+        return DirectorySink(chunks_dir)
+    if output_format == 'zip':
+        return ZipSink(os.path.join(chunks_dir, "chunks.zip"))
+    if output_format == 'tar':
+        return TarSink(os.path.join(chunks_dir, "chunks.tar"))
+    if output_format == 's3':
+        if not bucket:
+            raise ValueError("A bucket is required for the s3 output format")
+        return S3Sink(bucket, prefix, endpoint_url)
+    raise ValueError(f"Unknown output format: {output_format} (choose from {', '.join(OUTPUT_FORMATS)})")
@@ -1,6 +1,9 @@
 """
 User input handling utilities
 """
+import os
+from .compression import COMPRESSION_PROFILES, DEFAULT_COMPRESSION_PROFILE
+from .sinks import OUTPUT_FORMATS
 
 def get_chunk_size():
     """Get maximum chunk size from user input"""
@@ -46,4 +49,64 @@ def get_compression_settings():
             except ValueError:
                 print("❌ Please enter a valid number")
     
-    return compress_chunks, compression_quality 
\ No newline at end of file
+    return compress_chunks, compression_quality
+
+def get_compression_profile_name():
+    """Get compression profile (speed vs size trade-off) from user"""
+    print("\n⚡ Compression profiles:")
+    for name, profile in COMPRESSION_PROFILES.items():
+        print(f"   • {name}: {profile['description']}")
+    
+    while True:
+        profile_input = input(f"\n⚡ Compression profile (default {DEFAULT_COMPRESSION_PROFILE}): ").strip().lower()
+        if profile_input == '':
+            return DEFAULT_COMPRESSION_PROFILE
+        if profile_input in COMPRESSION_PROFILES:
+            return profile_input
+        print(f"❌ Please enter one of: {', '.join(COMPRESSION_PROFILES)}")
+
+def get_backend_selection_mode():
+    """Ask whether compression backends should be raced instead of tried in a fixed order"""
+    while True:
+        race_input = input("\n🏁 Race compression backends and reuse the smallest-output winner? (y/N): ").strip().lower()
+        if race_input in ['', 'n', 'no']:
+            return False
+        elif race_input in ['y', 'yes']:
+            return True
+        else:
+            print("❌ Please enter Y or N")
+
+def get_chunk_optimization():
+    """Ask whether committed chunks should be pruned, deduped and font-subset"""
+    while True:
+        optimize_input = input("\n✂️  Optimize chunks (drop unused resources, subset fonts)? (Y/n): ").strip().lower()
+        if optimize_input in ['', 'y', 'yes']:
+            return True
+        elif optimize_input in ['n', 'no']:
+            return False
+        else:
+            print("❌ Please enter Y or N")
+
+def get_output_format():
+    """Get output format for committed chunks (directory or streaming archive)"""
+    while True:
+        format_input = input(f"\n📦 Output format ({'/'.join(OUTPUT_FORMATS)}, default directory): ").strip().lower()
+        if format_input == '':
+            return 'directory'
+        if format_input in OUTPUT_FORMATS:
+            return format_input
+        print(f"❌ Please enter one of: {', '.join(OUTPUT_FORMATS)}")
+
+def get_s3_destination():
+    """Get S3 bucket and prefix from the user (defaults from CHONKIE_S3_BUCKET / CHONKIE_S3_PREFIX)"""
+    default_bucket = os.environ.get('CHONKIE_S3_BUCKET', '')
+    default_prefix = os.environ.get('CHONKIE_S3_PREFIX', '')
+    
+    while True:
+        bucket = input(f"\n☁️  S3 bucket{f' (default {default_bucket})' if default_bucket else ''}: ").strip() or default_bucket
+        if bucket:
+            break
+        print("❌ Please enter a bucket name")
+    
+    prefix = input(f"\n☁️  Key prefix{f' (default {default_prefix})' if default_prefix else ''}: ").strip() or default_prefix
+    return bucket, prefix
@@ -0,0 +1,244 @@
+"""
+Watch-folder daemon mode
+
+Watches the input directory (inotify via watchdog when installed, polling
+otherwise), waits until dropped files stop changing, and hands new or
+changed PDFs to a long-lived worker pool. A manifest in the chunks
+directory records what has been processed so restarts skip unchanged files.
+"""
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from .dependencies import WATCHDOG_AVAILABLE, load_module
+from .file_utils import find_pdf_files
+
+MANIFEST_NAME = "chonkie_manifest.json"
+
+def file_signature(path):
+    """Size and modification time used to detect new or changed files"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def load_manifest(chunks_dir):
+    """Load the processed-files manifest, empty if none exists yet"""
+    manifest_path = os.path.join(chunks_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError) as e:
+        print(f"   ⚠️  Could not read manifest, starting fresh: {e}")
+        return {}
+
+def save_manifest(chunks_dir, manifest):
+    """Atomically rewrite the processed-files manifest"""
+    manifest_path = os.path.join(chunks_dir, MANIFEST_NAME)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
+
+def _remove_local_chunk(location):
+    """Default chunk removal: delete the location if it is a local file"""
+    if os.path.isfile(location):
+        os.remove(location)
+
+def _create_event_handler(watcher):
+    """Build a watchdog handler forwarding PDF create/modify/move events to the watcher"""
+    events = load_module('watchdog.events')
+
+    class PdfEventHandler(events.FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            path = getattr(event, 'dest_path', None) or event.src_path
+            if path.lower().endswith('.pdf'):
+                watcher.notify(os.path.basename(path))
+
+    return PdfEventHandler()
+
+class FolderWatcher:
+    """
+    Process PDFs dropped into files_dir until stopped
+    process_file(pdf_file) returns the file's chunking info dict;
+    on_update(pdf_file, file_info) is called after each file so reports can be refreshed;
+    on_queued(pdf_file, signature) is called when a file is handed to the worker pool;
+    remove_chunk(location) deletes a chunk an earlier version of a changed file produced
+    (e.g. a sink's remove, local files by default)
+    """
+
+    def __init__(self, files_dir, chunks_dir, process_file, on_update=None,
+                 settle_seconds=2.0, poll_interval=1.0, max_workers=2, on_queued=None, remove_chunk=None):
+        self.files_dir = files_dir
+        self.chunks_dir = chunks_dir
+        self.process_file = process_file
+        self.on_update = on_update
+        self.on_queued = on_queued
+        self.remove_chunk = remove_chunk or _remove_local_chunk
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.manifest = load_manifest(chunks_dir)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chonkie-worker')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._candidates = set()
+        self._pending = {}
+        self._in_flight = set()
+        self._observer = None
+
+    def notify(self, pdf_file):
+        """Mark a file as possibly new or changed"""
+        with self._lock:
+            self._candidates.add(pdf_file)
+        self._wake.set()
+
+    def processed_files(self):
+        """Chunking info of every file in the manifest, as {pdf_file: file_info} (e.g. to seed a report after a restart)"""
+        with self._lock:
+            return {pdf_file: entry['file_info'] for pdf_file, entry in self.manifest.items() if entry.get('file_info')}
+
+    def _is_processed(self, pdf_file, signature):
+        entry = self.manifest.get(pdf_file)
+        return entry is not None and entry['signature'] == signature
+
+    def _ready_files(self):
+        """Return candidates whose size and mtime have been stable for settle_seconds"""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            candidates = list(self._candidates)
+
+        for pdf_file in candidates:
+            path = os.path.join(self.files_dir, pdf_file)
+            try:
+                signature = file_signature(path)
+            except OSError:
+                # Deleted or renamed before it settled
+                with self._lock:
+                    self._candidates.discard(pdf_file)
+                self._pending.pop(pdf_file, None)
+                continue
+
+            if pdf_file not in self._in_flight and self._is_processed(pdf_file, signature):
+                # Unchanged since it was last processed, no need to debounce
+                with self._lock:
+                    self._candidates.discard(pdf_file)
+                self._pending.pop(pdf_file, None)
+                continue
+
+            previous = self._pending.get(pdf_file)
+            if previous is None or previous[0] != signature:
+                # Still being copied, restart the debounce timer
+                self._pending[pdf_file] = (signature, now)
+                continue
+            if now - previous[1] < self.settle_seconds:
+                continue
+
+            with self._lock:
+                self._candidates.discard(pdf_file)
+            del self._pending[pdf_file]
+            if pdf_file not in self._in_flight:
+                ready.append((pdf_file, signature))
+        return ready
+
+    def _remove_stale_chunks(self, previous_chunks, current_chunks):
+        """Remove chunks of an earlier version of a changed file that the new version did not overwrite"""
+        for location in previous_chunks:
+            if location in current_chunks:
+                continue
+            try:
+                self.remove_chunk(location)
+            except Exception as e:
+                print(f"   ⚠️  Could not remove stale chunk {location}: {e}")
+
+    def _run_file(self, pdf_file, signature):
+        with self._lock:
+            previous_chunks = (self.manifest.get(pdf_file) or {}).get('chunks', [])
+        try:
+            print(f"\n👀 Processing {'changed' if pdf_file in self.manifest else 'new'} file: {pdf_file}")
+            file_info = self.process_file(pdf_file)
+            current_chunks = [chunk['path'] for chunk in file_info['chunks']]
+
+            with self._lock:
+                self.manifest[pdf_file] = {
+                    'signature': signature,
+                    'status': file_info['status'],
+                    'processed_at': datetime.now().isoformat(timespec='seconds'),
+                    'chunks': current_chunks,
+                    'file_info': file_info,
+                }
+                save_manifest(self.chunks_dir, self.manifest)
+            # Only after the new chunks are stored, so a chunk name both versions produce is never missing
+            self._remove_stale_chunks(previous_chunks, current_chunks)
+
+            if self.on_update:
+                self.on_update(pdf_file, file_info)
+        except Exception as e:
+            print(f"   ❌ Failed to process {pdf_file}: {e}")
+            # Record the failure so the file is only retried once it changes
+            with self._lock:
+                self.manifest[pdf_file] = {
+                    'signature': signature,
+                    'status': f'Error: {e}',
+                    'processed_at': datetime.now().isoformat(timespec='seconds'),
+                    'chunks': [],
+                }
+                save_manifest(self.chunks_dir, self.manifest)
+            self._remove_stale_chunks(previous_chunks, [])
+        finally:
+            with self._lock:
+                self._in_flight.discard(pdf_file)
+            # A newer copy may have landed while this one was processing
+            self.notify(pdf_file)
+
+    def _start_observer(self):
+        if not WATCHDOG_AVAILABLE:
+            print(f"👀 Polling '{self.files_dir}' every {self.poll_interval:.1f}s (install watchdog for inotify)")
+            return
+        self._observer = load_module('watchdog.observers').Observer()
+        self._observer.schedule(_create_event_handler(self), self.files_dir, recursive=False)
+        self._observer.start()
+        print(f"👀 Watching '{self.files_dir}' for new PDFs")
+
+    def run(self):
+        """Block and process files until stop() is called or Ctrl+C is pressed"""
+        # Pick up anything dropped while the daemon was not running
+        for pdf_file in find_pdf_files(self.files_dir):
+            self.notify(pdf_file)
+        self._start_observer()
+
+        try:
+            while not self._stop.is_set():
+                if not WATCHDOG_AVAILABLE:
+                    for pdf_file in find_pdf_files(self.files_dir):
+                        self.notify(pdf_file)
+
+                for pdf_file, signature in self._ready_files():
+                    with self._lock:
+                        self._in_flight.add(pdf_file)
+                    if self.on_queued:
+                        self.on_queued(pdf_file, signature)
+                    self._executor.submit(self._run_file, pdf_file, signature)
+
+                # Wake up early on events, but keep ticking while files settle
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping watcher...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop watching and wait for in-flight files to finish"""
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._executor.shutdown(wait=True)